@@ -0,0 +1,167 @@
+"""
+Headless batch export: convert position description files
+(see position_file) to psgo TeX files, using all the cores.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import argparse
+import os
+import sys
+
+import export_support as xp
+import position_file
+
+from dupindex import DuplicateIndex
+
+
+def prepare_file(fname, out_dir):
+    """Convert one position description file, without writing anything.
+    Return (fname, canonical key, list of (TeX file name, TeX),
+    list of errors)."""
+    base = os.path.splitext(os.path.basename(fname))[0]
+    try:
+        board = position_file.load(fname)
+    except (OSError, ValueError) as ex:
+        return fname, None, [], ["Cannot read {}: {}.".format(fname, ex)]
+    files = xp.tex_files(os.path.join(out_dir, base + ".tex"), board)
+    return fname, board.canonical_key(), files, []
+
+
+def export_file(fname, out_dir):
+    """Export one position description file to out_dir.
+    Return (fname, number of solutions, list of errors)."""
+    fname, _, files, errors = prepare_file(fname, out_dir)
+    if errors:
+        return fname, 0, errors
+    return fname, len(files) - 1, xp.write_files(files)
+
+
+def collect(paths, extension):
+    """Expand directories in paths to the files with given extension."""
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.endswith(extension)))
+        else:
+            result.append(path)
+    return result
+
+
+def problem_files(paths):
+    """Expand directories in paths to the problem (not solution)
+    TeX files in them."""
+    return [fname for fname in collect(paths, ".tex")
+            if fname in paths or "-sol-" not in os.path.basename(fname)]
+
+
+def run_all(func, fnames, arg, jobs=None):
+    """Call func(fname, arg) for all the files using a pool of jobs
+    processes (one per core by default, none if jobs is 1).
+    Yield the results in order."""
+    if jobs == 1:
+        for fname in fnames:
+            yield func(fname, arg)
+        return
+    if not fnames:
+        return
+    chunksize = max(1, len(fnames) // (4 * (jobs or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(func, fnames,
+                            [arg] * len(fnames), chunksize=chunksize)
+
+
+def export_all(fnames, out_dir, jobs=None):
+    """Export all the files using a pool of jobs processes
+    (one per core by default). Yield export_file results in order."""
+    yield from run_all(export_file, fnames, out_dir, jobs)
+
+
+def export_indexed(fnames, out_dir, index, skip=False, jobs=None):
+    """
+    Like export_all, but check every problem against DuplicateIndex
+    and add it there once it is written. The files are converted by
+    the pool and written here, in order, so the first of the duplicates
+    is the one kept.
+    Yield (fname, number of solutions, list of errors, duplicate);
+    duplicates are not written if skip is True.
+    """
+    for fname, key, files, errors in run_all(prepare_file, fnames,
+                                             out_dir, jobs):
+        if errors:
+            yield fname, 0, errors, False
+            continue
+        duplicate = key in index
+        if not (duplicate and skip):
+            errors = xp.write_files(files)
+            # only the problems written are indexed
+            if not errors:
+                index.add(key)
+        yield fname, len(files) - 1, errors, duplicate
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Convert position descriptions to psgo TeX files.")
+    parser.add_argument('paths', nargs='+',
+                        help="position files or directories with them")
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help="where to write TeX files (default: .)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes (default: cores)")
+    parser.add_argument('-e', '--extension', default='.pos',
+                        help="extension of position files in directories "
+                        "(default: .pos)")
+    parser.add_argument('--index', metavar='FILE',
+                        help="warn about problems already in this "
+                        "duplicate index (created if missing)")
+    parser.add_argument('--skip-duplicates', action='store_true',
+                        help="do not write the duplicates (needs --index)")
+    args = parser.parse_args(argv)
+    if args.skip_duplicates and not args.index:
+        parser.error("--skip-duplicates needs --index")
+
+    index = None
+    if args.index:
+        try:
+            index = DuplicateIndex(args.index)
+        except (OSError, ValueError) as ex:
+            parser.error("cannot open index {}: {}".format(args.index, ex))
+
+    fnames = collect(args.paths, args.extension)
+    if index is None:
+        results = ((fname, sols, errors, False) for fname, sols, errors
+                   in export_all(fnames, args.output_dir, args.jobs))
+    else:
+        results = export_indexed(fnames, args.output_dir, index,
+                                 args.skip_duplicates, args.jobs)
+    problems = solutions = failed = duplicates = 0
+    try:
+        for fname, sols, errors, duplicate in results:
+            if duplicate:
+                duplicates += 1
+                print("{} duplicates an indexed problem{}.".format(
+                    fname, ", skipped" if args.skip_duplicates else ""),
+                    file=sys.stderr)
+                if args.skip_duplicates:
+                    continue
+            if errors:
+                failed += 1
+                for error in errors:
+                    print(error, file=sys.stderr)
+            else:
+                problems += 1
+                solutions += sols
+    finally:
+        if index is not None:
+            index.close()
+    print("{} problems ({} solutions) written, {} duplicates, "
+          "{} failed.".format(problems, solutions, duplicates, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
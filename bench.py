@@ -0,0 +1,222 @@
+"""
+Benchmarks for board, export and render hot paths.
+
+Run `python bench.py` to print ops/sec and peak memory per operation;
+`--save FILE` stores the results as a baseline and `--compare FILE`
+prints the speed relative to the saved baseline.
+"""
+
+from time import perf_counter
+
+import argparse
+import json
+import random
+import tracemalloc
+
+import export_image as xi
+import export_support as xp
+
+from board import Board
+from renderer import Renderer
+from stone import Stone
+
+
+class FakeScreen():
+    """In-memory stand-in for asciimatics Screen."""
+    def __init__(self, height=30, width=60):
+        self.dimensions = (height, width)
+        self.cells = {}
+
+    def print_at(self, text, col, row, colour=7, attr=0, bg=0):
+        """Put text to the cells."""
+        for shift, char in enumerate(text):
+            self.cells[(col + shift, row)] = (char, colour, attr, bg)
+
+    def clear(self):
+        """Clear all the cells."""
+        self.cells.clear()
+
+    def refresh(self):
+        """Nothing to do."""
+
+
+# Positions {{{1
+
+def _empty():
+    return Board()
+
+
+def _corner():
+    # the problem from README
+    black = ['b3', 'd3', 'b4', 'd2', 'e1']
+    white = ['d5', 'g2', 'b5', 'c4', 'e4', 'e3', 'e2']
+    solution = [('1', 'black', 'a2'), ('2', 'white', 'b1'),
+                ('3', 'black', 'a4'), ('4', 'white', 'c2'),
+                ('5', 'black', 'c3'), ('6', 'white', 'd1'),
+                ('7', 'black', 'b2'), ('8', 'white', 'f1'),
+                ('9', 'black', 'a1')]
+
+    def _pt(name):
+        return (xp.COLUMNS.index(name[0]), int(name[1:]) - 1)
+
+    stones = {_pt(p): Stone('black') for p in black}
+    stones.update({_pt(p): Stone('white') for p in white})
+    sol = {_pt(p): Stone(colour, label=label)
+           for label, colour, p in solution}
+    return Board(stones, [sol])
+
+
+def _full():
+    rnd = random.Random(19)
+    return Board({(x, y): Stone(rnd.choice(('black', 'white')))
+                  for x in range(19) for y in range(19)})
+
+
+def _branches():
+    rnd = random.Random(42)
+    board = _corner()
+    for _ in range(40):
+        board.add_solution()
+        for label in range(1, 10):
+            board.set_cursor((rnd.randrange(9), rnd.randrange(9)))
+            board.put_sol(('black', 'white')[label % 2], str(label))
+    board.select_solution(0)
+    return board
+
+
+POSITIONS = {'empty': _empty, 'corner': _corner,
+             'full': _full, 'branches': _branches}
+
+# }}}1
+
+# Benchmarks {{{1
+
+
+def _mutations(board):
+    moves = ['right'] * 9 + ['up'] + ['left'] * 9 + ['up']
+
+    def _run():
+        for move in moves:
+            board.move_cursor(move)
+            board.toggle('black')
+            board.update_colour('white')
+            board.toggle('white')
+    return _run
+
+
+def _get_items(board):
+    def _run():
+        for _ in board.get_items().items():
+            pass
+    return _run
+
+
+def _to_tex(board):
+    return lambda: board.to_tex(main_only=False)
+
+
+def _solutions_to_tex(board):
+    return board.solutions_to_tex
+
+
+def _stone_to_tex(board):
+    items = list(board.get_items().items())
+
+    def _run():
+        for point, stone in items:
+            xp.stone_to_tex(stone, point)
+    return _run
+
+
+def _to_svg(board):
+    return lambda: xi.image_files('bench.svg', board, 'svg')
+
+
+def _to_png(board):
+    return lambda: xi.image_files('bench.png', board, 'png')
+
+
+def _render_board(board):
+    renderer = Renderer({'display': 'unicode'}, FakeScreen())
+
+    def _run():
+        renderer.begin()
+        renderer.render_status('black', 'normal')
+        renderer.render_board(board)
+        renderer.end()
+        # Force something to change, like the cursor moving
+        board.move_cursor('right')
+    return _run
+
+
+BENCHMARKS = {'mutations': _mutations, 'get_items': _get_items,
+              'to_tex': _to_tex, 'solutions_to_tex': _solutions_to_tex,
+              'stone_to_tex': _stone_to_tex,
+              'to_svg': _to_svg, 'to_png': _to_png,
+              'render_board': _render_board}
+
+# }}}1
+
+
+def measure(run, min_time):
+    """Return (ops/sec, peak bytes allocated by one op)."""
+    run()  # warm up caches
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    count, number = 0, 1
+    start = perf_counter()
+    while True:
+        for _ in range(number):
+            run()
+        count += number
+        elapsed = perf_counter() - start
+        if elapsed >= min_time:
+            return count / elapsed, peak
+        number *= 2
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-k', '--filter', default='',
+                        help="run only benchmarks with this substring")
+    parser.add_argument('-t', '--min-time', type=float, default=0.2,
+                        help="seconds per benchmark (default: 0.2)")
+    parser.add_argument('--save', metavar='FILE',
+                        help="save results as a baseline")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="compare results with a saved baseline")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as inp:
+            baseline = json.load(inp)
+
+    results = {}
+    print("{:30} {:>12} {:>10} {:>8}".format(
+        "benchmark", "ops/sec", "peak KiB", "vs base"))
+    for bench_name, bench in BENCHMARKS.items():
+        for pos_name, position in POSITIONS.items():
+            name = "{}/{}".format(bench_name, pos_name)
+            if args.filter not in name:
+                continue
+            ops, peak = measure(bench(position()), args.min_time)
+            results[name] = {'ops': ops, 'peak': peak}
+            if name in baseline:
+                ratio = "{:.2f}x".format(ops / baseline[name]['ops'])
+            else:
+                ratio = "-"
+            print("{:30} {:12.1f} {:10.1f} {:>8}".format(
+                name, ops, peak / 1024, ratio))
+
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
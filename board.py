@@ -1,28 +1,57 @@
 """Board model."""
 
-from copy import deepcopy
-from operator import itemgetter
+from collections import deque
 
 import export_support as xp
 
 from cursor import Cursor
+from position import Overlay, Position
+from rules import Rules
 from stone import Stone
+from variations import VariationTree
 
 
 _MIN_CORNER_SIZE = 4
 _MIN_BORDER = 1
 
+# Labels are stored in bytes (see position.Position)
+MAX_LABEL = 255
+
+UNDO_DEPTH = 1000
+
+_KEY_MASK = (1 << 64) - 1
+_SOLUTION_MIX = 0x9e3779b97f4a7c15
+
+
+def _clamp_dim(extent):
+    return min(max(_MIN_CORNER_SIZE, extent + _MIN_BORDER), 19)
+
 
 class Board():
     """
     Entity that stores position and can render it to screen
     or to TeX string.
     """
-    def __init__(self, board=None, solutions=None):
-        self._board = board or {}
+    def __init__(self, board=None, solutions=None, undo_depth=UNDO_DEPTH):
+        self._board = Position(board)
         self._solution_idx = None
-        self._solutions = solutions or []
+        # Solution branches share their common first moves
+        self._solutions = VariationTree(solutions)
+        # Captures in solution branches; made again when the main
+        # position changes
+        self._rules = None
         self._cursor = Cursor()
+        # Edit journal: every entry is a small operation which knows
+        # how to revert itself, see _revert().
+        self._undo = deque(maxlen=undo_depth)
+        self._redo = deque(maxlen=undo_depth)
+        self._listener = None
+
+    def set_listener(self, listener):
+        """Set the object to be notified about every change: it should
+        have stone_set(idx, point, stone), branch_inserted(idx, branch)
+        and branch_deleted(idx) methods; idx is None for main position."""
+        self._listener = listener
 
     # Cursor {{{1
 
@@ -34,24 +63,23 @@ class Board():
         """Return cursor coordinates."""
         return self._cursor.point
 
+    def set_cursor(self, point):
+        """Move cursor to the given point."""
+        self._cursor.point = point
+
     # }}}1
 
     # TeX support {{{1
 
-    def _get_psgo_prelude(self, solution_index=None):
-        point = (self._get_dim(0, False, solution_index) + 1,
-                 self._get_dim(1, False, solution_index) + 1)
-        return xp.psgo_prelude(point)
+    def get_corner(self, solution_index=None):
+        """Return the top right corner (counted from 1, as psgo does)
+        of the diagram of the main position or the solution."""
+        return (self._get_dim(0, False, solution_index) + 1,
+                self._get_dim(1, False, solution_index) + 1)
 
     def _objects_to_tex(self, objects, solution_index=None):
-
-        result = [self._get_psgo_prelude(solution_index=solution_index)]
-        for point, stone in objects.items():
-            result.append(xp.stone_to_tex(stone, point))
-
-        result.append(xp.psgo_postlude())
-
-        return '\n'.join(result)
+        return xp.objects_to_tex(
+            objects, self.get_corner(solution_index=solution_index))
 
     def to_tex(self, main_only=True):
         """Convert the board position to TeX code.
@@ -64,37 +92,63 @@ class Board():
         return self._objects_to_tex(objects)
 
     def solutions_to_tex(self):
-        """Convert solutions to the list of TeX code strings."""
-        results = []
-        for idx in range(len(self._solutions)):
-            objects = self.get_items(solution_index=idx)
-            results.append(self._objects_to_tex(objects, idx))
+        """Convert solutions to the list of TeX code strings.
+        The tree of moves is walked once, so the lines for the moves
+        common to several branches are made once."""
+        results = [None] * len(self._solutions)
+        main_lines = [(point, xp.stone_to_tex(stone, point))
+                      for point, stone in self._board.items()]
+        main_extent = (max(0, self._board.extent(0)),
+                       max(0, self._board.extent(1)))
+        # TeX lines for the moves of done[:len(lines)]
+        done = []
+        lines = []
+        rules = self._get_rules()
+        for indices, path in self._solutions.walk():
+            common = 0
+            while common < min(len(done), len(path)) and \
+                    done[common] is path[common]:
+                common += 1
+            del done[common:], lines[common:]
+            for node in path[common:]:
+                done.append(node)
+                lines.append(xp.stone_to_tex(node.stone, node.point))
+            extent = path[-1].extent if path else (-1, -1)
+            corner = (_clamp_dim(max(main_extent[0], extent[0])) + 1,
+                      _clamp_dim(max(main_extent[1], extent[1])) + 1)
+            rules.follow((node.point, node.stone) for node in path)
+            # captured moves stay, so the branch can be read back
+            covered = rules.captured().union(node.point for node in path)
+            tex = "\n".join([xp.psgo_prelude(corner)] +
+                             [line for point, line in main_lines
+                              if point not in covered] +
+                             lines + [xp.psgo_postlude()])
+            for idx in indices:
+                results[idx] = tex
         return results
 
+    def diagrams(self):
+        """Yield (read-only view of items, corner) for the main position
+        and every solution, in the order of the TeX files."""
+        yield Overlay(self._board), self.get_corner()
+        for idx in range(len(self._solutions)):
+            yield self.get_items(solution_index=idx), self.get_corner(idx)
+
     # }}}1
 
     # Geometry {{{1
 
     def _get_dim(self, axis, use_cursor, idx):
 
-        maxkey = itemgetter(axis)
-
-        if self._board:
-            res = max(self._board.keys(), key=maxkey)[axis]
-        else:
-            res = 0
+        res = max(0, self._board.extent(axis))
 
         if idx is not None:
-            sol = self._solutions[idx]
-            if sol:
-                res = max(res, max(sol.keys(), key=maxkey)[axis])
+            res = max(res, self._solutions.branch(idx).extent(axis))
 
         if use_cursor:
             res = max(res, self._cursor.point[axis])
 
-        res = max(_MIN_CORNER_SIZE, res + _MIN_BORDER)
-
-        return min(res, 19)
+        return _clamp_dim(res)
 
     def get_width(self, use_cursor=True):
         """Return the width of used part of the board."""
@@ -108,30 +162,59 @@ class Board():
 
     # Manipulate stones in main position {{{1
 
+    def _position(self, idx):
+        if idx is None:
+            return self._board
+        return self._solutions.branch(idx)
+
+    def _store(self, idx, point, stone):
+        if idx is not None:
+            self._solutions.set_stone(idx, point, stone)
+        else:
+            self._rules = None
+            if stone is not None:
+                self._board[point] = stone
+            elif point in self._board:
+                del self._board[point]
+        if self._listener is not None:
+            self._listener.stone_set(idx, point, stone)
+
+    def _set(self, idx, point, stone):
+        """Put stone (None to remove) at point of the main position
+        (idx is None) or of the solution branch idx, journaling it."""
+        old = self._position(idx).get(point)
+        if old is stone:
+            return
+        self._store(idx, point, stone)
+        self._journal(('set', idx, point, old, stone))
+
+    def set_stone(self, point, stone, solution_index=None):
+        """Put stone (None to remove) at point of the main position
+        or of the given solution branch."""
+        self._set(solution_index, point, stone)
+
     def put(self, colour):
         """Put stone at cursor."""
-        self._board[self._cursor.point] = Stone(colour)
+        self._set(None, self._cursor.point, Stone(colour))
 
     def remove(self):
         """Remove stone at cursor."""
-        point = self._cursor.point
-        if point in self._board:
-            del self._board[point]
+        self._set(None, self._cursor.point, None)
 
     def toggle(self, colour):
         """Put or remove stone at cursor."""
         point = self._cursor.point
         if point in self._board:
-            del self._board[point]
+            self._set(None, point, None)
         else:
-            self._board[point] = Stone(colour)
+            self._set(None, point, Stone(colour))
 
     def update_colour(self, colour):
         """Update colour of the stone under the cursor,
         if there is one."""
         point = self._cursor.point
         if point in self._board:
-            self._board[point].colour = colour
+            self._set(None, point, self._board[point].with_colour(colour))
 
     # }}}1
 
@@ -140,34 +223,37 @@ class Board():
     def put_sol(self, colour, number):
         """Add a stone to solution."""
         assert self._solution_idx is not None
-        point = self._cursor.point
-        self._solutions[self._solution_idx][point] = \
-            Stone(colour, label=number)
+        self._set(self._solution_idx, self._cursor.point,
+                  Stone(colour, label=number))
 
     def remove_sol(self):
         """Remove a stone from solution."""
         assert self._solution_idx is not None
-        point = self._cursor.point
-        if point in self._solutions[self._solution_idx]:
-            del self._solutions[self._solution_idx][point]
+        self._set(self._solution_idx, self._cursor.point, None)
 
     def update_colour_sol(self, colour):
         """Update colour of the solution stone under the cursor,
         if there is one."""
         assert self._solution_idx is not None
-        sol = self._solutions[self._solution_idx]
+        sol = self._solutions.branch(self._solution_idx)
         point = self._cursor.point
         if point in sol:
-            sol[point].colour = colour
+            self._set(self._solution_idx, point,
+                      sol[point].with_colour(colour))
+
+    def next_label(self):
+        """Return the number for the next move of solution branch."""
+        assert self._solution_idx is not None
+        return self._solutions.branch(self._solution_idx).last_label() + 1
 
     def flip_sol(self):
         """Flip colour of the solution stone under the cursor,
         if there is one: white <-> black."""
         assert self._solution_idx is not None
-        sol = self._solutions[self._solution_idx]
+        sol = self._solutions.branch(self._solution_idx)
         point = self._cursor.point
         if point in sol:
-            sol[point].flip()
+            self._set(self._solution_idx, point, sol[point].flip())
 
     # }}}1
 
@@ -177,14 +263,42 @@ class Board():
         """Return current solution branch."""
         return self._solution_idx
 
+    def solution_count(self):
+        """Return the number of solution branches."""
+        return len(self._solutions)
+
+    def select_solution(self, idx):
+        """Switch to the given solution branch (None for main line)."""
+        assert idx is None or 0 <= idx < len(self._solutions)
+        self._solution_idx = idx
+
+    def _insert_branch(self, idx, branch):
+        self._solutions.insert(idx, branch)
+        if self._listener is not None:
+            self._listener.branch_inserted(idx, self._solutions.branch(idx))
+
+    def _pop_branch(self, idx):
+        branch = self._solutions.pop(idx)
+        if self._listener is not None:
+            self._listener.branch_deleted(idx)
+        return branch
+
+    def insert_solution(self, idx):
+        """Insert empty solution branch at idx and switch to it."""
+        self._insert_branch(idx, None)
+        self._solution_idx = idx
+        self._journal(('add', idx))
+
     def add_solution(self):
         """Add solution branch and switch to it."""
-        self._solutions.append({})
-        self._solution_idx = len(self._solutions) - 1
+        self.insert_solution(len(self._solutions))
 
-    def delete_solution(self):
-        """Remove solution branch."""
-        del self._solutions[self._solution_idx]
+    def delete_solution(self, idx=None):
+        """Remove solution branch idx (by default the current one)."""
+        if idx is None:
+            idx = self._solution_idx
+        self._journal(('delete', idx, self._pop_branch(idx)))
+        self._solution_idx = idx
         if self._solutions:
             self._solution_idx %= len(self._solutions)
         else:
@@ -224,18 +338,105 @@ class Board():
 
     # }}}1
 
+    # Undo {{{1
+
+    def _journal(self, entry):
+        self._undo.append(entry)
+        self._redo.clear()
+
+    def _revert(self, entry):
+        """Revert the journal entry; return the entry reverting that."""
+        kind, idx = entry[:2]
+        if kind == 'set':
+            _, _, point, old, new = entry
+            self._store(idx, point, old)
+            self._cursor.point = point
+            self._solution_idx = idx
+            return ('set', idx, point, new, old)
+        if kind == 'add':
+            removed = self._pop_branch(idx)
+            self._solution_idx = idx - 1 if idx else None
+            return ('delete', idx, removed)
+        # kind == 'delete'
+        self._insert_branch(idx, entry[2])
+        self._solution_idx = idx
+        return ('add', idx)
+
+    def undo(self):
+        """Revert the last change. Return False if there is nothing
+        to undo."""
+        if not self._undo:
+            return False
+        self._redo.append(self._revert(self._undo.pop()))
+        return True
+
+    def redo(self):
+        """Repeat the last undone change. Return False if there is
+        nothing to redo."""
+        if not self._redo:
+            return False
+        self._undo.append(self._revert(self._redo.pop()))
+        return True
+
+    # }}}1
+
+    # Position identity {{{1
+
+    def position_key(self, solution_index=None):
+        """Return Zobrist hash of the main position or, if solution_index
+        is given, of the main position with that solution branch."""
+        key = self._board.zobrist()
+        if solution_index is not None:
+            # Mix solution key, so its stones never cancel main ones out
+            key ^= (self._solutions.branch(solution_index).zobrist() *
+                    _SOLUTION_MIX) & _KEY_MASK
+        return key
+
+    def canonical_key(self):
+        """Return the key of the main position which is the same for all
+        its rotations and reflections, with colours swapped or not."""
+        return self._board.canonical_key()
+
+    # }}}1
+
     # {{{1 Access to board items
 
-    def get_items(self, solution_index=None):
-        """Return board items."""
-        res = self._board.copy()
+    def _get_rules(self):
+        if self._rules is None:
+            self._rules = Rules(self._board)
+        return self._rules
+
+    def _follow(self, idx):
+        """Return Rules with the moves of solution branch idx played."""
+        rules = self._get_rules()
+        rules.follow(self._solutions.branch(idx).items())
+        return rules
+
+    def move_errors(self, solution_index=None):
+        """Return the dict mapping the points of illegal moves of the
+        solution branch (by default the current one) to the reasons."""
+        if solution_index is None:
+            solution_index = self._solution_idx
+        if solution_index is None:
+            return {}
+        return self._follow(solution_index).errors()
+
+    def get_moves(self, solution_index):
+        """Return the list of (point, stone) moves of the solution branch,
+        in order of numbers."""
+        return list(self._solutions.branch(solution_index).items())
+
+    def get_items(self, solution_index=None, main_only=False):
+        """Return read-only view of board items (of the main position
+        only if main_only is True)."""
         if solution_index is not None:
             idx = solution_index
         else:
             idx = self._solution_idx
-        if idx is not None:
-            # Order matters, numbers should overwrite stones!
-            res.update(deepcopy(self._solutions[idx]))
-        return res
+        if idx is None or main_only:
+            return Overlay(self._board)
+        # Numbers should overwrite stones, captured ones are gone
+        return Overlay(self._board, self._solutions.branch(idx),
+                       self._follow(idx).captured())
 
     # }}}1
@@ -0,0 +1,285 @@
+"""
+Incremental problem book build.
+
+Given the problems directory, write the lists of problems and
+solutions that misc/problem-book.tex and misc/problem-book-solutions.tex
+include, plus a one-page sheet per problem (the problem with its
+solutions), and run the TeX compiler on the documents whose inputs
+changed since the last build. Content hashes of the inputs are kept
+in the manifest file in the output directory.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+
+
+MANIFEST = ".problem-book.json"
+BOOK = "problem-book"
+SOLUTIONS_BOOK = "problem-book-solutions"
+SHEETS_DIR = "sheets"
+
+# Run in the directory of the document; {name} is its name without .tex
+COMPILER = ("latex -interaction=batchmode {name}.tex"
+            " && dvips -q {name}.dvi && ps2pdf {name}.ps")
+
+_SHEET = r"""\documentclass{{article}}
+\usepackage{{psgo}}
+\setgounit{{0.4cm}}
+\pagestyle{{empty}}
+\begin{{document}}
+\setlength{{\parindent}}{{0pt}}
+{}
+\end{{document}}
+"""
+
+
+def scan(problems_dir, prefix='problem'):
+    """Return the list of (problem file, list of its solution files)
+    in problems_dir, ordered by numbers."""
+    pattern = re.compile(r"{}-(\d+)(?:-sol-(\d+))?\.tex$".format(
+        re.escape(prefix)))
+    problems = {}
+    solutions = {}
+    for name in os.listdir(problems_dir):
+        match = pattern.match(name)
+        if not match:
+            continue
+        number, sol_number = match.groups()
+        if sol_number is None:
+            problems[int(number)] = name
+        else:
+            solutions.setdefault(int(number), []).append(
+                (int(sol_number), name))
+    return [(problems[number], [name for _, name in
+                                sorted(solutions.get(number, ()))])
+            for number in sorted(problems)]
+
+
+def _tex_path(fname, start):
+    """Return fname relative to start, as \\input wants it."""
+    return os.path.splitext(os.path.relpath(fname, start))[0].replace(
+        os.sep, '/')
+
+
+def _lists(problems, problems_dir, out_dir):
+    """Return the contents of the problem and the solution lists."""
+    book = []
+    solutions_book = []
+    for problem, sols in problems:
+        book.append(r"\problem{{{}}}".format(
+            _tex_path(os.path.join(problems_dir, problem), out_dir)))
+        solutions_book.append(r"\refstepcounter{ProblemNumber}")
+        for number, sol in enumerate(sols, 1):
+            solutions_book.append(r"\solution{{{}}}{{{}}}".format(
+                _tex_path(os.path.join(problems_dir, sol), out_dir), number))
+    return "\n".join(book) + "\n", "\n".join(solutions_book) + "\n"
+
+
+def _sheet(problem, sols, problems_dir, sheets_dir):
+    """Return the sheet document for the problem."""
+    inputs = [r"\input{{{}}}".format(
+        _tex_path(os.path.join(problems_dir, fname), sheets_dir))
+              for fname in [problem] + sols]
+    return _SHEET.format("\n\n\\bigskip\n".join(inputs))
+
+
+def _write_if_changed(fname, text):
+    """Write text to fname unless it is there already.
+    Return True if the file was written."""
+    try:
+        with open(fname) as inp:
+            if inp.read() == text:
+                return False
+    except OSError:
+        pass
+    with open(fname, 'w') as out:
+        out.write(text)
+    return True
+
+
+class Manifest():
+    """
+    Content hashes of the build inputs and of the inputs of every
+    compiled document. A file is hashed again only when its size
+    or modification time changes.
+    """
+    def __init__(self, fname):
+        self._fname = fname
+        self._files = {}
+        self._targets = {}
+        try:
+            with open(fname) as inp:
+                data = json.load(inp)
+            self._files = data['files']
+            self._targets = data['targets']
+        except (OSError, ValueError, KeyError):
+            pass  # build everything
+
+    def file_hash(self, fname):
+        """Return the hash of the file content."""
+        stat = os.stat(fname)
+        entry = self._files.get(fname)
+        if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+        with open(fname, 'rb') as inp:
+            digest = hashlib.sha1(inp.read()).hexdigest()
+        self._files[fname] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def target_hash(self, fnames, extra=''):
+        """Return the hash of the files (and extra text) together."""
+        digest = hashlib.sha1(extra.encode())
+        for fname in fnames:
+            digest.update(fname.encode())
+            digest.update(self.file_hash(fname).encode())
+        return digest.hexdigest()
+
+    def is_built(self, target, digest):
+        """Return True if target was built from the inputs with digest."""
+        return self._targets.get(target) == digest
+
+    def built(self, target, digest):
+        """Remember that target was built from the inputs with digest."""
+        self._targets[target] = digest
+
+    def forget_missing(self, targets):
+        """Drop the documents not in targets and the files
+        which do not exist any more."""
+        self._targets = {target: digest for target, digest
+                         in self._targets.items() if target in targets}
+        self._files = {fname: entry for fname, entry
+                       in self._files.items() if os.path.exists(fname)}
+
+    def save(self):
+        """Write the manifest."""
+        tmp_name = self._fname + '.tmp'
+        with open(tmp_name, 'w') as out:
+            json.dump({'files': self._files, 'targets': self._targets},
+                      out, indent=1, sort_keys=True)
+        os.replace(tmp_name, self._fname)
+
+
+def compile_document(fname, compiler=COMPILER):
+    """Run the compiler for the document. Return the list of errors."""
+    directory, name = os.path.split(os.path.abspath(fname))
+    command = compiler.format(name=shlex.quote(os.path.splitext(name)[0]))
+    result = subprocess.run(command, shell=True, cwd=directory,
+                            stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, check=False)
+    if result.returncode:
+        return ["Failed to compile {}: '{}' exited with {}.".format(
+            fname, command, result.returncode)]
+    return []
+
+
+def build(problems_dir, out_dir, compiler=COMPILER, jobs=None,
+          prefix='problem', books=True):
+    """
+    Build everything that changed. The books (out_dir/problem-book.tex
+    and out_dir/problem-book-solutions.tex) are compiled only if books
+    is True and they exist. Yield (document, list of errors) for every
+    compiled document, in order.
+    """
+    # pylint:disable=too-many-arguments,too-many-locals
+    sheets_dir = os.path.join(out_dir, SHEETS_DIR)
+    os.makedirs(sheets_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(out_dir, MANIFEST))
+
+    problems = scan(problems_dir, prefix)
+    todo = []  # (document, its inputs digest)
+
+    def _add(document, inputs):
+        digest = manifest.target_hash(inputs, extra=compiler)
+        if not manifest.is_built(document, digest):
+            todo.append((document, digest))
+
+    for problem, sols in problems:
+        sheet = os.path.join(sheets_dir, problem)
+        _write_if_changed(sheet, _sheet(problem, sols,
+                                        problems_dir, sheets_dir))
+        _add(sheet, [sheet] + [os.path.join(problems_dir, fname)
+                               for fname in [problem] + sols])
+
+    lists = _lists(problems, problems_dir, out_dir)
+    if books:
+        for book, book_list, book_files in (
+                (BOOK, lists[0], [problem for problem, _ in problems]),
+                (SOLUTIONS_BOOK, lists[1],
+                 [sol for _, sols in problems for sol in sols])):
+            list_name = os.path.join(out_dir, book + "-list.tex")
+            _write_if_changed(list_name, book_list)
+            document = os.path.join(out_dir, book + ".tex")
+            if os.path.exists(document):
+                _add(document, [document, list_name] +
+                     [os.path.join(problems_dir, fname)
+                      for fname in book_files])
+
+    manifest.forget_missing({os.path.join(sheets_dir, problem)
+                             for problem, _ in problems} |
+                            {os.path.join(out_dir, book + ".tex")
+                             for book in (BOOK, SOLUTIONS_BOOK)})
+    try:
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            futures = [(document, digest,
+                        pool.submit(compile_document, document, compiler))
+                       for document, digest in todo]
+            for document, digest, future in futures:
+                errors = future.result()
+                if not errors:
+                    manifest.built(document, digest)
+                yield document, errors
+    finally:
+        manifest.save()
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Build problem sheets and books, compiling "
+        "only what changed.")
+    parser.add_argument('problems', help="directory with the problems")
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="where the books are (default: the parent "
+                        "of the problems directory)")
+    parser.add_argument('-p', '--prefix', default='problem',
+                        help="problem file names prefix (default: problem)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of compilers to run at once "
+                        "(default: cores)")
+    parser.add_argument('--compiler', default=COMPILER,
+                        help="command to compile {{name}}.tex, run in "
+                        "its directory (default: {})".format(
+                            COMPILER.replace('%', '%%')))
+    parser.add_argument('--no-books', action='store_true',
+                        help="build the problem sheets only")
+    args = parser.parse_args(argv)
+
+    out_dir = args.output_dir
+    if out_dir is None:
+        out_dir = os.path.dirname(os.path.abspath(args.problems))
+    compiled = failed = 0
+    for document, errors in build(args.problems, out_dir, args.compiler,
+                                  args.jobs, args.prefix,
+                                  not args.no_books):
+        if errors:
+            failed += 1
+            for error in errors:
+                print(error, file=sys.stderr)
+        else:
+            compiled += 1
+            print("Compiled {}.".format(document))
+    print("{} documents compiled, {} failed.".format(compiled, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Clipboard backends.
+
+Nothing is imported or looked for until the first copy: then the
+backend named by PSGO_CLIPBOARD environment variable (or --clipboard)
+is used, or the first one available of: Windows clipboard, pbcopy,
+wl-copy, xclip, xsel, OSC 52 terminal escape sequence (over SSH) and,
+when everything else fails, a file.
+"""
+# pylint:disable=import-outside-toplevel
+
+import os
+import sys
+
+
+ENV_VAR = 'PSGO_CLIPBOARD'
+FALLBACK_FILE = "psgo_emitter-clipboard.tex"
+
+_COMMAND_TIMEOUT = 5.0
+
+
+def _win32(text):
+    import win32clipboard
+    win32clipboard.OpenClipboard()
+    try:
+        win32clipboard.EmptyClipboard()
+        win32clipboard.SetClipboardText(text)
+    finally:
+        win32clipboard.CloseClipboard()
+    return "Position copied to clipboard."
+
+
+def _command(*args):
+    """Return the backend piping the text to the command."""
+    def _copy(text):
+        import subprocess
+        try:
+            result = subprocess.run(args, input=text.encode(),
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL,
+                                    timeout=_COMMAND_TIMEOUT, check=False)
+        except subprocess.TimeoutExpired as ex:
+            raise OSError("{} timed out".format(args[0])) from ex
+        if result.returncode:
+            raise OSError("{} exited with {}".format(
+                args[0], result.returncode))
+        return "Position copied to clipboard ({}).".format(args[0])
+    return _copy
+
+
+def _osc52(text):
+    import base64
+    with open('/dev/tty', 'w') as tty:
+        tty.write("\033]52;c;{}\a".format(
+            base64.b64encode(text.encode()).decode('ascii')))
+    return "Position sent to the terminal clipboard."
+
+
+def _file(text):
+    with open(FALLBACK_FILE, 'w') as out:
+        out.write(text)
+    return "Position written to {}.".format(FALLBACK_FILE)
+
+
+BACKENDS = {
+    'win32': _win32,
+    'pbcopy': _command('pbcopy'),
+    'wl-copy': _command('wl-copy'),
+    'xclip': _command('xclip', '-selection', 'clipboard'),
+    'xsel': _command('xsel', '--clipboard', '--input'),
+    'osc52': _osc52,
+    'file': _file,
+}
+
+
+def detect():
+    """Return the name of the best backend available here."""
+    from shutil import which
+    if sys.platform == 'win32':
+        return 'win32'
+    if sys.platform == 'darwin' and which('pbcopy'):
+        return 'pbcopy'
+    if os.environ.get('WAYLAND_DISPLAY') and which('wl-copy'):
+        return 'wl-copy'
+    if os.environ.get('DISPLAY'):
+        for name in ('xclip', 'xsel'):
+            if which(name):
+                return name
+    if os.environ.get('SSH_TTY'):
+        return 'osc52'
+    return 'file'
+
+
+class Clipboard():
+    """
+    Entity that copies text with the backend called name, or with
+    the one from the environment or detected on the first copy.
+    """
+    def __init__(self, name=None):
+        if name is not None and name not in BACKENDS:
+            raise ValueError("unknown clipboard backend {}".format(name))
+        self._name = name
+
+    def name(self):
+        """Return the backend name, or None if not chosen yet."""
+        return self._name
+
+    def copy(self, text):
+        """Copy text. Return the message to show. If the backend fails,
+        the text is written to the file (and the file is used from now
+        on); raise OSError if that fails too."""
+        if self._name is None:
+            name = os.environ.get(ENV_VAR) or detect()
+            if name not in BACKENDS:
+                raise ValueError("unknown clipboard backend {} in {}".format(
+                    name, ENV_VAR))
+            self._name = name
+        try:
+            return BACKENDS[self._name](text)
+        except (OSError, ImportError) as ex:
+            if self._name == 'file':
+                raise
+            failed, self._name = self._name, 'file'
+            return "{} failed ({}). {}".format(failed, ex, _file(text))
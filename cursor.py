@@ -11,6 +11,11 @@ class Cursor():
         """Return cursor position."""
         return tuple(self._point)
 
+    @point.setter
+    def point(self, value):
+        """Move cursor to the given point."""
+        self._point = list(value)
+
     def _change(self, axis, delta):
         self._point[axis] += delta
         self._point[axis] %= 19
@@ -0,0 +1,111 @@
+"""
+On-disk index of emitted problems, to find duplicates.
+
+The index is a memory-mapped open addressing hash table of canonical
+position keys (see Board.canonical_key), so rotated, reflected and
+colour swapped copies of a problem are found as well. The file is
+a header followed by 64-bit slots in native byte order; 0 marks
+an empty slot. The table is doubled when it gets half full.
+"""
+
+from array import array
+
+import mmap
+import os
+import struct
+
+
+_MAGIC = b"PSGOIDX1"
+_HEADER = struct.Struct("=8sQQ")  # magic, capacity, count
+_MIN_CAPACITY = 1024
+
+
+class DuplicateIndex():
+    """Persistent set of canonical position keys."""
+    def __init__(self, fname):
+        self._fname = fname
+        if not os.path.exists(fname):
+            self._create(fname, _MIN_CAPACITY, array('Q'))
+        self._open()
+
+    @staticmethod
+    def _create(fname, capacity, keys):
+        """Write the table with given capacity and keys to fname."""
+        slots = array('Q', [0]) * capacity
+        mask = capacity - 1
+        for key in keys:
+            slot = key & mask
+            while slots[slot]:
+                slot = (slot + 1) & mask
+            slots[slot] = key
+        tmp_name = fname + '.tmp'
+        with open(tmp_name, 'wb') as out:
+            out.write(_HEADER.pack(_MAGIC, capacity, len(keys)))
+            slots.tofile(out)
+        os.replace(tmp_name, fname)
+
+    def _open(self):
+        # pylint:disable=consider-using-with
+        self._file = open(self._fname, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self._capacity, self._count = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            self._map.close()
+            self._file.close()
+            raise ValueError("{} is not a duplicate index".format(
+                self._fname))
+        self._slots = memoryview(self._map)[_HEADER.size:].cast('Q')
+
+    def _find(self, key):
+        """Return the slot holding key or the empty slot for it."""
+        slots = self._slots
+        mask = self._capacity - 1
+        slot = key & mask
+        while True:
+            value = slots[slot]
+            if value == key or not value:
+                return slot
+            slot = (slot + 1) & mask
+
+    def __contains__(self, key):
+        key = key or 1  # 0 marks empty slots
+        return self._slots[self._find(key)] == key
+
+    def __len__(self):
+        return self._count
+
+    def add(self, key):
+        """Add key. Return False if it was already there."""
+        key = key or 1
+        slot = self._find(key)
+        if self._slots[slot]:
+            return False
+        self._slots[slot] = key
+        self._count += 1
+        _HEADER.pack_into(self._map, 0, _MAGIC, self._capacity, self._count)
+        if 2 * self._count > self._capacity:
+            self._grow()
+        return True
+
+    def _grow(self):
+        keys = array('Q', (key for key in self._slots if key))
+        capacity = 2 * self._capacity
+        self.close()
+        self._create(self._fname, capacity, keys)
+        self._open()
+
+    def flush(self):
+        """Write changes to disk."""
+        self._map.flush()
+
+    def close(self):
+        """Close the index."""
+        self._slots.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,27 +1,58 @@
 """
 Utility to save go positions as psgo tex files.
+
+The UI (asciimatics and the renderer) and the modules needed only
+for some options are imported when they are needed, so the start
+is quick and --help works without them.
 """
+# pylint:disable=import-outside-toplevel
 
-from time import sleep, strftime
+from time import monotonic, strftime
 
+import argparse
 import os
 import sys
 
-from asciimatics.screen import Screen
-from asciimatics.event import KeyboardEvent
+from state import State
+from board import Board, MAX_LABEL, UNDO_DEPTH
+from clipboard import BACKENDS, Clipboard, ENV_VAR as CLIPBOARD_ENV_VAR
+from session import SESSION_FILE, SessionLog, replay
+from writer import BackgroundWriter
+import export_support as xp
+import instrument
+
 
-import win32clipboard
+# Seconds to wait for input before checking for finished saves
+# or fsyncing the session log
+_SAVE_POLL_TIMEOUT = 0.05
+_LOG_SYNC_TIMEOUT = 1.0
+_IDLE_TIMEOUT = 60.0
 
-from renderer import Renderer
-from state import State
-from board import Board
+# Redraw no more often than that, 0 for no limit
+_MAX_FPS = 30
+
+# Key code of Ctrl-L, the usual key to redraw a terminal program
+_CTRL_L = 12
+
+# Functions timed when instrumentation is enabled
+_TIMED_HANDLERS = ('_cursor_move_handler', '_board_keys_handler',
+                   '_solution_branch_change_handler', '_undo_handler',
+                   '_handle_solution_keys', '_to_file', '_to_clipboard')
+_TIMED_BOARD = ('get_items', 'get_width', 'get_height', 'get_cursor')
+_TIMED_RENDERER = ('begin', 'render_status', 'render_board', 'end')
+
+
+def _cursor_keys():
+    """Return the dict mapping arrow key codes to cursor directions."""
+    from asciimatics.screen import Screen
+    return {Screen.KEY_DOWN: 'down',
+            Screen.KEY_UP: 'up',
+            Screen.KEY_LEFT: 'left',
+            Screen.KEY_RIGHT: 'right'}
 
 
-def _cursor_move_handler(board, state, evt):
-    direction = {Screen.KEY_DOWN: 'down',
-                 Screen.KEY_UP: 'up',
-                 Screen.KEY_LEFT: 'left',
-                 Screen.KEY_RIGHT: 'right'}.get(evt.key_code)
+def _cursor_move_handler(board, state, cursor_keys, evt):
+    direction = cursor_keys.get(evt.key_code)
     if direction:
         board.move_cursor(direction)
     else:
@@ -68,47 +99,35 @@ def _board_keys_handler(board, state, evt):
     return True
 
 
-def _to_clipboard(board, renderer):
-    win32clipboard.OpenClipboard()
-    win32clipboard.EmptyClipboard()
-    win32clipboard.SetClipboardText(board.to_tex(main_only=False))
-    win32clipboard.CloseClipboard()
-    renderer.info_flash("Position copied to clipboard.")
+def _to_clipboard(board, renderer, clipboard):
+    try:
+        renderer.info_flash(clipboard.copy(board.to_tex(main_only=False)))
+    except (OSError, ValueError) as ex:
+        renderer.error_flash("Cannot copy: {}.".format(ex))
 
 
-def _to_file(fname_pattern, idx, board, renderer):
+def _to_file(fname_pattern, idx, board, writer, renderer):
     fname = fname_pattern.format(idx)
     bname = os.path.basename(fname)
-    err = ""
-    msg = ""
-    if os.path.exists(fname):
-        err += "Cannot write {}, file exists".format(bname)
-    else:
-        try:
-            with open(fname, 'w') as out:
-                out.writelines(board.to_tex())
-        except OSError as ex:
-            err += "Failed to write {}: {}.".format(bname, ex)
-
-    sols = board.solutions_to_tex()
-    for sol_idx, tex_solution in enumerate(sols):
-        fname_sol = fname[:-4]  # remove ".tex"
-        fname_sol += "-sol-{}.tex".format(sol_idx + 1)
-        bname_sol = os.path.basename(fname_sol)
-        if os.path.exists(fname_sol):
-            err += "Cannot write {}, file exists".format(bname_sol)
+    files = xp.tex_files(fname, board)
+    writer.submit(files, (bname, len(files) - 1, board.canonical_key()))
+    renderer.info_flash("Saving '{}'...".format(bname))
+
+
+def _report_saves(writer, renderer, index=None):
+    """Flash the results of finished saves and add the saved problems
+    to the index. Return True if there were any."""
+    done = writer.poll()
+    for (bname, sols, key), errors in done:
+        if errors:
+            renderer.error_flash(" ".join(errors))
         else:
-            try:
-                with open(fname_sol, 'w') as out:
-                    out.writelines(tex_solution)
-            except OSError as ex:
-                err += "Failed to write {}: {}.".format(bname, ex)
-
-    if err:
-        renderer.error_flash(err)
-    else:
-        msg = "Board saved to '{}' ({} solutions).".format(bname, len(sols))
-        renderer.warning_flash(msg)
+            msg = "Board saved to '{}' ({} solutions).".format(bname, sols)
+            # The problem is saved anyway, the duplicate is only reported
+            if index is not None and not index.add(key):
+                msg += " It duplicates an indexed problem!"
+            renderer.warning_flash(msg)
+    return bool(done)
 
 
 def _solution_branch_change_handler(board, state, renderer, evt):
@@ -133,7 +152,30 @@ def _solution_branch_change_handler(board, state, renderer, evt):
     return True
 
 
-def _handle_solution_keys(board, state, evt):
+def _undo_handler(board, state, renderer, evt):
+    if evt.key_code == ord('u'):
+        if not board.undo():
+            renderer.error_flash("Nothing to undo.")
+    elif evt.key_code == ord('r'):
+        if not board.redo():
+            renderer.error_flash("Nothing to redo.")
+    else:
+        return False
+
+    state.set_solution(board.get_solution())
+    renderer.set_solution_index(state.solution())
+    return True
+
+
+def _put_move(board, state, renderer, number):
+    board.put_sol(state.colour(), number)
+    state.swap_colour()
+    error = board.move_errors().get(board.get_cursor())
+    if error:
+        renderer.warning_flash("Illegal move ({}).".format(error))
+
+
+def _handle_solution_keys(board, state, renderer, evt):
     code = evt.key_code
     if code == ord('x'):
         state.swap_colour()
@@ -143,8 +185,13 @@ def _handle_solution_keys(board, state, evt):
     elif code == ord(' '):
         board.flip_sol()
     elif ord('1') <= code <= ord('9'):
-        board.put_sol(state.colour(), chr(code))
-        state.swap_colour()
+        _put_move(board, state, renderer, chr(code))
+    elif code == ord('n'):
+        # the next number, past 9 too; labels are bytes
+        number = board.next_label()
+        if number > MAX_LABEL:
+            return True
+        _put_move(board, state, renderer, str(number))
     elif code == ord('0'):
         board.remove_sol()
     else:
@@ -153,6 +200,37 @@ def _handle_solution_keys(board, state, evt):
     return True
 
 
+def _pending_key(screen):
+    """Return the next queued keyboard event, None if there is none."""
+    evt = screen.get_event()
+    # skip mouse events, they have no key_code
+    while evt is not None and not hasattr(evt, 'key_code'):
+        evt = screen.get_event()
+    return evt
+
+
+def _wait_for_key(screen, timeout):
+    """
+    Return the next keyboard event. If there is none, sleep until
+    there is some input or timeout expires; return None on timeout.
+    """
+    evt = _pending_key(screen)
+    if evt is None:
+        screen.wait_for_input(timeout)
+        evt = _pending_key(screen)
+    return evt
+
+
+def _load_problem(board, main, solutions):
+    for point, stone in main.items():
+        board.set_stone(point, stone)
+    for stones in solutions:
+        board.add_solution()
+        for point, stone in stones.items():
+            board.set_stone(point, stone, board.get_solution())
+    board.select_solution(None)
+
+
 def _update_title(renderer, fname_pattern, idx):
     fname = fname_pattern.format(idx)
     renderer.set_title("Working on {}".format(fname))
@@ -169,31 +247,35 @@ def _redraw(board, state, renderer):
     renderer.end()
 
 
-def mainloop(fname_pattern, idx):
-    """Main loop."""
-    def _body(screen, fname_pattern=fname_pattern, idx=idx):
-
-        board = Board()
+def mainloop(fname_pattern, idx, board, state, log=None, resumed=False,
+             instr=None, index=None, clipboard=None):
+    """Main loop, starting with board and state.
+    log is SessionLog the board changes go to, or None for no log.
+    resumed is True if the session was restored from the log.
+    instr is Instrumentation to time event dispatch, or None.
+    index is DuplicateIndex of the saved problems, or None.
+    clipboard is Clipboard to copy to, by default the one detected
+    on the first copy."""
+    # pylint:disable=too-many-statements,too-many-arguments
+    def _body(screen, fname_pattern=fname_pattern, idx=idx, board=board,
+              state=state, clipboard=clipboard or Clipboard()):
+        from renderer import Renderer
 
-        state = State()
+        config = {'display': 'unicode', 'fps': _MAX_FPS,
+                  'undo_depth': UNDO_DEPTH}
 
-        config = {'display': 'unicode'}
         renderer = Renderer(config, screen)
+        cursor_keys = _cursor_keys()
 
-        _update_title(renderer, fname_pattern, idx)
-        renderer.info_flash("Welcome!")
-
-        _redraw(board, state, renderer)
+        writer = BackgroundWriter()
 
-        while True:
-            evt = screen.get_event()
-            if not evt or not isinstance(evt, KeyboardEvent):
-                sleep(0.1)
-                continue
+        def _handle(evt):
+            """Process evt. Return False if it is time to quit."""
+            nonlocal board, state, idx
 
             # QUIT
             if evt.key_code == ord('Q'):
-                break
+                return False
 
             # META-OPERATIONS
 
@@ -201,21 +283,34 @@ def mainloop(fname_pattern, idx):
             if evt.key_code == ord('d'):
                 config['display'] = {'unicode': 'ascii',
                                      'ascii': 'unicode'}[config['display']]
+            # Redraw the whole screen (Ctrl-L)
+            elif evt.key_code == _CTRL_L:
+                renderer.invalidate()
             # Write to file
             elif evt.key_code == ord('w'):
-                _to_file(fname_pattern, idx, board, renderer)
+                _to_file(fname_pattern, idx, board, writer, renderer)
                 idx += 1
+                if log:
+                    log.saved(idx)
                 _update_title(renderer, fname_pattern, idx)
             # Copy to clipboard
             elif evt.key_code == ord('c'):
-                _to_clipboard(board, renderer)
+                _to_clipboard(board, renderer, clipboard)
             # Clear the board
             elif evt.key_code == ord('C'):
-                board = Board()
+                if log:
+                    log.cleared()
+                board = Board(undo_depth=config['undo_depth'])
+                board.set_listener(log)
                 state = State()
                 renderer.set_solution_index(None)
                 renderer.info_flash("Board cleared.")
 
+            # UNDO/REDO
+            elif _undo_handler(board, state, renderer, evt):
+                # handled
+                pass
+
             # SOLUTION BRANCHES MANIPULATION
             elif _solution_branch_change_handler(board, state,
                                                  renderer, evt):
@@ -223,13 +318,13 @@ def mainloop(fname_pattern, idx):
                 pass
 
             # CURSOR
-            elif _cursor_move_handler(board, state, evt):
+            elif _cursor_move_handler(board, state, cursor_keys, evt):
                 # handled
                 pass
 
             # "IN-SOLUTION STATE CHANGES"
             elif state.solution() is not None:
-                if _handle_solution_keys(board, state, evt):
+                if _handle_solution_keys(board, state, renderer, evt):
                     # handled
                     pass
                 # nothing to do in solution
@@ -239,25 +334,162 @@ def mainloop(fname_pattern, idx):
                 # handled
                 pass
 
+            return True
+
+        if instr:
+            _handle = instr.wrap('dispatch', _handle)
+
+        _update_title(renderer, fname_pattern, idx)
+        renderer.set_solution_index(state.solution())
+        renderer.info_flash("Session resumed." if resumed else "Welcome!")
+
+        _redraw(board, state, renderer)
+        last_frame = monotonic()
+
+        while True:
+            # Sleep until a key is pressed; wake up periodically
+            # only while there are saves to report or log to fsync.
+            timeout = _SAVE_POLL_TIMEOUT if writer.pending() \
+                else _LOG_SYNC_TIMEOUT if log and log.dirty() \
+                else _IDLE_TIMEOUT
+            evt = _wait_for_key(screen, timeout)
+            if evt is None:
+                if log:
+                    log.sync()
+                if _report_saves(writer, renderer, index):
+                    _redraw(board, state, renderer)
+                    last_frame = monotonic()
+                continue
+
+            # Apply all the queued keys (auto-repeat produces plenty),
+            # waiting for more of them until the next frame is due,
+            # then draw once.
+            batch_start = monotonic()
+            while evt is not None:
+                if not _handle(evt):
+                    writer.close()
+                    # the saves finished meanwhile go to the index
+                    _report_saves(writer, renderer, index)
+                    if log:
+                        log.close()
+                    return
+                evt = _pending_key(screen)
+                if evt is None and config['fps']:
+                    delay = last_frame + 1 / config['fps'] - monotonic()
+                    if delay > 0:
+                        evt = _wait_for_key(screen, delay)
+
+            if log:
+                log.state(state, board.get_cursor())
+                log.sync()
+
+            _report_saves(writer, renderer, index)
             _redraw(board, state, renderer)
+            last_frame = monotonic()
+            if instr:
+                instr.record('key-to-screen', last_frame - batch_start)
 
     return _body
 
 
 def main():
     """Entry point."""
-    if len(sys.argv) > 1:
-        fname_pattern = sys.argv[1] + "-{}.tex"
+    parser = argparse.ArgumentParser(
+        description="Create psgo diagrams for go problems.")
+    parser.add_argument('prefix', nargs='?',
+                        help="common part of the names of files to write")
+    parser.add_argument('start', nargs='?', default='1',
+                        help="the first sequential number (default: 1)")
+    parser.add_argument('--session', default=SESSION_FILE,
+                        help="session log file (default: {})".format(
+                            SESSION_FILE))
+    parser.add_argument('--resume', action='store_true',
+                        help="restore the session from the session log")
+    parser.add_argument('--open', metavar='FILE',
+                        help="start with the problem (and its solutions) "
+                        "from psgo TeX file")
+    parser.add_argument('--index', metavar='FILE',
+                        help="warn when a saved problem is already in "
+                        "this duplicate index (created if missing)")
+    parser.add_argument('--clipboard', choices=sorted(BACKENDS),
+                        help="how to copy to clipboard (default: {} or "
+                        "the first one available)".format(
+                            CLIPBOARD_ENV_VAR))
+    parser.add_argument('--profile', nargs='?', const='', metavar='FILE',
+                        help="time key handling and rendering, print "
+                        "the summary on exit; with FILE, save cProfile "
+                        "stats there too (or set {} to 1 or FILE)".format(
+                            instrument.ENV_VAR))
+    args = parser.parse_args()
+
+    if args.prefix:
+        fname_pattern = args.prefix + "-{}.tex"
     else:
         fname_pattern = strftime("%Y-%m-%d-%H-%M-problem-{}.tex")
     idx = 1
-    if len(sys.argv) > 2:
+    try:
+        idx = int(args.start)
+    except ValueError:
+        pass
+
+    board = Board(undo_depth=UNDO_DEPTH)
+    state = State()
+    log = None
+    if args.resume:
         try:
-            idx = int(sys.argv[2])
-        except ValueError:
-            pass
+            fname_pattern, idx, board, state, size = \
+                replay(args.session, UNDO_DEPTH)
+            log = SessionLog.append(args.session, size)
+        except (OSError, ValueError) as ex:
+            parser.error("cannot resume the session: {}".format(ex))
+
+    problem = None
+    if args.open:
+        import psgo_parser
+        try:
+            problem = psgo_parser.read(args.open)
+        except (OSError, ValueError) as ex:
+            parser.error("cannot open {}: {}".format(args.open, ex))
+
+    index = None
+    if args.index:
+        from dupindex import DuplicateIndex
+        try:
+            index = DuplicateIndex(args.index)
+        except (OSError, ValueError) as ex:
+            parser.error("cannot open index {}: {}".format(args.index, ex))
+
+    from asciimatics.screen import Screen
+    from renderer import Renderer
 
-    Screen.wrapper(mainloop(fname_pattern, idx))
+    instr = instrument.create(args.profile)
+    if instr:
+        instr.patch(sys.modules[__name__], _TIMED_HANDLERS, 'handler:')
+        instr.patch(Board, _TIMED_BOARD, 'board:')
+        instr.patch(Renderer, _TIMED_RENDERER, 'render:')
+        instr.start()
+
+    if not args.resume:
+        try:
+            log = SessionLog.create(args.session, fname_pattern)
+        except OSError as ex:
+            print("Cannot create session log {}: {}; going on "
+                  "without it.".format(args.session, ex), file=sys.stderr)
+    board.set_listener(log)
+    if problem and not args.resume:
+        _load_problem(board, *problem)
+
+    try:
+        Screen.wrapper(mainloop(fname_pattern, idx, board, state, log,
+                                args.resume, instr, index,
+                                Clipboard(args.clipboard)))
+    finally:
+        if index is not None:
+            index.close()
+
+    if instr:
+        instr.stop()
+        print(instr.summary())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,320 @@
+"""
+Export diagrams to SVG and PNG images, without LaTeX.
+
+Images show the same part of the board as psgo diagrams do. Both
+formats are put together from cached pieces: SVG from the text of
+the grid and stones, PNG from pixel tiles of cells, so one image
+is mostly joining byte strings.
+"""
+
+from functools import lru_cache
+from io import StringIO
+
+import argparse
+import os
+import struct
+import sys
+import zlib
+
+import export_support as xp
+import psgo_parser
+
+from batch import problem_files
+
+
+SIZE = 19
+
+SVG_CELL = 20   # user units
+PNG_CELL = 24   # pixels
+
+# 3x5 digits for stone labels in PNG
+_DIGITS = {
+    '0': ("###", "#.#", "#.#", "#.#", "###"),
+    '1': (".#.", "##.", ".#.", ".#.", "###"),
+    '2': ("###", "..#", "###", "#..", "###"),
+    '3': ("###", "..#", ".##", "..#", "###"),
+    '4': ("#.#", "#.#", "###", "..#", "..#"),
+    '5': ("###", "#..", "###", "..#", "###"),
+    '6': ("###", "#..", "###", "#.#", "###"),
+    '7': ("###", "..#", ".#.", ".#.", ".#."),
+    '8': ("###", "#.#", "###", "#.#", "###"),
+    '9': ("###", "#.#", "###", "..#", "###"),
+}
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _is_hoshi(col, row):
+    return (col - 3) % 6 == 0 and (row - 3) % 6 == 0
+
+
+def _geometry(corner):
+    """Return (columns, rows, is right side closed, is top side closed)
+    of the diagram with given psgo corner."""
+    cols, rows = min(corner[0], SIZE), min(corner[1], SIZE)
+    return cols, rows, corner[0] >= SIZE, corner[1] >= SIZE
+
+
+# SVG {{{1
+
+@lru_cache(maxsize=None)
+def _svg_prelude(corner):
+    """SVG header, styles and the grid with hoshi."""
+    cols, rows, right, top = _geometry(corner)
+    cell = SVG_CELL
+    half = cell / 2
+    width, height = cols * cell, rows * cell
+
+    def _x(col):
+        return col * cell + half
+
+    def _y(row):
+        return (rows - 1 - row) * cell + half
+
+    lines = []
+    for col in range(cols):
+        lines.append("M{} {}V{}".format(
+            _x(col), _y(rows - 1) if top else 0, _y(0)))
+    for row in range(rows):
+        lines.append("M{} {}H{}".format(
+            _x(0), _y(row), _x(cols - 1) if right else width))
+    edges = ["M{} {}V{}H{}".format(_x(0), _y(rows - 1) if top else 0,
+                                   _y(0), _x(cols - 1) if right else width)]
+    if right:
+        edges.append("M{} {}V{}".format(
+            _x(cols - 1), _y(rows - 1) if top else 0, _y(0)))
+    if top:
+        edges.append("M{} {}H{}".format(
+            _x(0), _y(rows - 1), _x(cols - 1) if right else width))
+    hoshi = "".join(
+        '<circle cx="{}" cy="{}" r="{}"/>'.format(_x(col), _y(row), cell / 8)
+        for col in range(cols) for row in range(rows)
+        if _is_hoshi(col, row))
+
+    return "".join((
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink" ',
+        'width="{0}" height="{1}" viewBox="0 0 {0} {1}">\n'.format(
+            width, height),
+        "<defs><style>",
+        "text{font:bold ", str(cell * 0.55), "px sans-serif;",
+        "text-anchor:middle;dominant-baseline:central}",
+        ".black{fill:#fff}.white{fill:#000}.small{font-size:",
+        str(cell * 0.4), "px}",
+        "</style>",
+        '<circle id="black" r="{}" stroke="#000"/>'.format(half - 0.5),
+        '<circle id="white" r="{}" fill="#fff" stroke="#000"/>'.format(
+            half - 1),
+        "</defs>\n",
+        '<rect width="100%" height="100%" fill="#fff"/>\n',
+        '<path d="', "".join(lines), '" stroke="#000" fill="none"/>\n',
+        '<path d="', "".join(edges),
+        '" stroke="#000" stroke-width="2" fill="none"/>\n',
+        hoshi, "\n"))
+
+
+def _svg_postlude():
+    return "</svg>\n"
+
+
+@lru_cache(maxsize=8192)
+def _svg_stone(colour, label, p_x, p_y, rows):
+    x_pos = p_x * SVG_CELL + SVG_CELL / 2
+    y_pos = (rows - 1 - p_y) * SVG_CELL + SVG_CELL / 2
+    text = ""
+    if label:
+        text = '<text x="{}" y="{}" class="{}{}">{}</text>'.format(
+            x_pos, y_pos, colour, " small" if len(label) > 2 else "", label)
+    return '<use xlink:href="#{}" x="{}" y="{}"/>{}\n'.format(
+        colour, x_pos, y_pos, text)
+
+
+def objects_to_svg(objects, corner):
+    """Convert (point, stone) items of objects to SVG image
+    of the board between bottom left corner and given (psgo) point."""
+    rows = _geometry(corner)[1]
+    out = StringIO()
+    out.write(_svg_prelude(corner))
+    for (p_x, p_y), stone in objects.items():
+        out.write(_svg_stone(stone.colour, stone.label, p_x, p_y, rows))
+    out.write(_svg_postlude())
+    return out.getvalue()
+
+# }}}1
+
+
+# PNG {{{1
+
+@lru_cache(maxsize=None)
+def _cell_tile(cell, arms, edges, hoshi):
+    """
+    Return the rows (bytes, grey levels) of an empty cell tile.
+    arms are (left, right, up, down) flags of the lines going from
+    the centre, edges are (horizontal, vertical) flags of the lines
+    at the board edge (drawn thicker).
+    """
+    left, right, up, down = arms
+    centre = cell // 2
+    pixels = [bytearray(b"\xff" * cell) for _ in range(cell)]
+    h_width, v_width = 1 + edges[0], 1 + edges[1]
+    for row in range(centre - h_width + 1, centre + 1):
+        for col in range(0 if left else centre - v_width + 1,
+                         cell if right else centre + 1):
+            pixels[row][col] = 0
+    for col in range(centre - v_width + 1, centre + 1):
+        for row in range(0 if up else centre - h_width + 1,
+                         cell if down else centre + 1):
+            pixels[row][col] = 0
+    if hoshi:
+        radius = cell / 8
+        for row in range(cell):
+            for col in range(cell):
+                if (row - centre + 0.5) ** 2 + (col - centre + 0.5) ** 2 \
+                        <= radius ** 2:
+                    pixels[row][col] = 0
+    return tuple(bytes(row) for row in pixels)
+
+
+@lru_cache(maxsize=None)
+def _label_mask(cell, label):
+    """Return the set of (row, col) pixels of the label text."""
+    scale = max(1, cell // 12)
+    while scale > 1 and len(label) * 4 * scale - scale > cell * 0.7:
+        scale -= 1
+    width = len(label) * 4 * scale - scale
+    top = (cell - 5 * scale) // 2
+    left = (cell - width) // 2
+    mask = set()
+    for idx, char in enumerate(label):
+        for g_row, line in enumerate(_DIGITS.get(char, ())):
+            for g_col, dot in enumerate(line):
+                if dot != '#':
+                    continue
+                p_row = top + g_row * scale
+                p_col = left + (idx * 4 + g_col) * scale
+                mask.update((p_row + d_row, p_col + d_col)
+                            for d_row in range(scale)
+                            for d_col in range(scale))
+    return frozenset(mask)
+
+
+@lru_cache(maxsize=4096)
+def _stone_tile(cell, background, colour, label):
+    """Return the rows of the stone tile drawn over background tile,
+    antialiased with 4x4 samples per pixel."""
+    centre = cell / 2
+    radius = centre - 0.5
+    ring = 1.5 if colour == 'white' else 0
+    fill = 0 if colour == 'black' else 255
+    mask = _label_mask(cell, label) if label else ()
+    samples = [(i + 0.5) / 4 for i in range(4)]
+    rows = []
+    for row in range(cell):
+        pixels = bytearray(background[row])
+        for col in range(cell):
+            if (row, col) in mask:
+                pixels[col] = 255 - fill
+                continue
+            total = 0
+            for s_y in samples:
+                for s_x in samples:
+                    dist = ((row + s_y - centre) ** 2 +
+                            (col + s_x - centre) ** 2) ** 0.5
+                    if dist > radius:
+                        total += background[row][col]
+                    elif dist <= radius - ring:
+                        total += fill  # else the outline, black
+            pixels[col] = total // 16
+        rows.append(bytes(pixels))
+    return tuple(rows)
+
+
+def _png_chunk(tag, data):
+    return b"".join((struct.pack(">I", len(data)), tag, data,
+                     struct.pack(">I", zlib.crc32(tag + data))))
+
+
+def _png(width, height, raw):
+    """Return PNG file with 8-bit grey image from raw scanlines."""
+    return b"".join((
+        _PNG_SIGNATURE,
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height,
+                                        8, 0, 0, 0, 0)),
+        # previews: compression speed matters more than size
+        _png_chunk(b"IDAT", zlib.compress(raw, 1)),
+        _png_chunk(b"IEND", b"")))
+
+
+def objects_to_png(objects, corner, cell=PNG_CELL):
+    """Convert (point, stone) items of objects to PNG image
+    of the board between bottom left corner and given (psgo) point."""
+    cols, rows, right, top = _geometry(corner)
+    stones = dict(objects.items())
+    scanlines = []
+    for row in reversed(range(rows)):
+        tiles = []
+        for col in range(cols):
+            tile = _cell_tile(
+                cell,
+                (col > 0, col < cols - 1 or not right,
+                 row < rows - 1 or not top, row > 0),
+                (row == 0 or (top and row == rows - 1),
+                 col == 0 or (right and col == cols - 1)),
+                _is_hoshi(col, row))
+            stone = stones.get((col, row))
+            if stone:
+                tile = _stone_tile(cell, tile, stone.colour, stone.label)
+            tiles.append(tile)
+        # every scanline starts with filter type 0 (none)
+        scanlines.extend(b"\0" + b"".join(parts) for parts in zip(*tiles))
+    return _png(cols * cell, rows * cell, b"".join(scanlines))
+
+# }}}1
+
+
+def image_files(fname, board, image_format='svg'):
+    """Return the list of (file name, image) pairs for the problem
+    and all its solutions; fname ends with .svg or .png."""
+    convert = {'svg': objects_to_svg, 'png': objects_to_png}[image_format]
+    files = []
+    for idx, (objects, corner) in enumerate(board.diagrams()):
+        files.append((fname if idx == 0 else
+                      xp.solution_file_name(fname, idx - 1),
+                      convert(objects, corner)))
+    return files
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Draw psgo TeX problems and their solutions "
+        "as SVG or PNG images.")
+    parser.add_argument('paths', nargs='+',
+                        help="problem TeX files or directories with them")
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help="where to write images (default: .)")
+    parser.add_argument('-f', '--format', choices=('svg', 'png'),
+                        default='svg', help="image format (default: svg)")
+    args = parser.parse_args(argv)
+
+    problems = failed = 0
+    for fname in problem_files(args.paths):
+        base = os.path.splitext(os.path.basename(fname))[0]
+        try:
+            board = psgo_parser.load(fname)
+        except (OSError, ValueError) as ex:
+            errors = ["Cannot read {}: {}.".format(fname, ex)]
+        else:
+            errors = xp.write_files(image_files(
+                os.path.join(args.output_dir, base + "." + args.format),
+                board, args.format))
+        for error in errors:
+            print(error, file=sys.stderr)
+        failed += bool(errors)
+        problems += not errors
+    print("{} problems drawn, {} failed.".format(problems, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,21 @@
 """Export support functions."""
 
+from functools import lru_cache
+from io import StringIO
 
+import os
+
+
+# psgo column letters; there is no 'i' column, 'h' is followed by 'j'
+COLUMNS = 'abcdefghjklmnopqrst'
+
+
+@lru_cache(maxsize=None)
 def psgo_prelude(point):
     """Prelude for psgo TeX code, for partial board between
     bottom left corner and given point."""
-    prelude = r"\begin{psgopartialboard}{(1,1)("
-    prelude += str(point[0])
-    prelude += r","
-    prelude += str(point[1])
-    prelude += r")}"
-    return prelude
+    return r"\begin{psgopartialboard}{(1,1)(" + \
+        str(point[0]) + "," + str(point[1]) + ")}"
 
 
 def psgo_postlude():
@@ -17,19 +23,62 @@ def psgo_postlude():
     return r"\end{psgopartialboard}"
 
 
+@lru_cache(maxsize=8192)
+def _stone_line(colour, label, p_x, p_y):
+    if label:
+        mark = r"[\marklb{" + label + "}]"
+    else:
+        mark = ""
+    return "".join((r"        \stone", mark, "{", colour, "}{",
+                    COLUMNS[p_x], "}{", str(p_y + 1), "}"))
+
+
 def stone_to_tex(stone, point):
     """Convert stone at the given point to psgo TeX code."""
-    line = ' ' * 8
-    line += r"\stone"
-    if stone.label:
-        line += r"[\marklb{" + stone.label + r"}]"
-    line += r"{" + stone.colour + r"}{"
-    p_x, p_y = point
-    # no 'i', should jump to 'j'!
-    if p_x >= ord('i') - ord('a'):
-        p_x += 1
-    line += chr(ord('a') + p_x)
-    line += r"}{"
-    line += str(p_y + 1)
-    line += r"}"
-    return line
+    return _stone_line(stone.colour, stone.label, *point)
+
+
+def objects_to_tex(objects, point):
+    """Convert (point, stone) items of objects to psgo TeX code
+    for partial board between bottom left corner and given point."""
+    out = StringIO()
+    out.write(psgo_prelude(point))
+    out.write("\n")
+    for stone_point, stone in objects.items():
+        out.write(_stone_line(stone.colour, stone.label, *stone_point))
+        out.write("\n")
+    out.write(psgo_postlude())
+    return out.getvalue()
+
+
+def solution_file_name(fname, sol_idx):
+    """File name for the solution with the given (zero-based) index
+    of the problem written to fname (with the same extension)."""
+    base, ext = os.path.splitext(fname)
+    return "{}-sol-{}{}".format(base, sol_idx + 1, ext)
+
+
+def tex_files(fname, board):
+    """Return the list of (file name, TeX code) pairs for the problem
+    and all its solutions."""
+    files = [(fname, board.to_tex())]
+    for sol_idx, tex_solution in enumerate(board.solutions_to_tex()):
+        files.append((solution_file_name(fname, sol_idx), tex_solution))
+    return files
+
+
+def write_files(files):
+    """Write (file name, TeX code) pairs, never overwriting existing files.
+    The content may be bytes too (for images).
+    Return the list of error messages."""
+    errors = []
+    for fname, tex in files:
+        bname = os.path.basename(fname)
+        try:
+            with open(fname, 'xb' if isinstance(tex, bytes) else 'x') as out:
+                out.write(tex)
+        except FileExistsError:
+            errors.append("Cannot write {}, file exists.".format(bname))
+        except OSError as ex:
+            errors.append("Failed to write {}: {}.".format(bname, ex))
+    return errors
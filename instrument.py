@@ -0,0 +1,134 @@
+"""
+Optional latency instrumentation.
+
+Nothing here is used unless instrumentation is enabled (with --profile
+or PSGO_PROFILE environment variable), so it costs nothing otherwise:
+the timed functions are wrapped only when it is enabled.
+"""
+
+from functools import wraps
+from time import perf_counter
+
+import os
+
+
+ENV_VAR = 'PSGO_PROFILE'
+
+# Histogram buckets: bucket n counts durations below 2**n microseconds
+_BUCKETS = 32
+
+
+class Histogram():
+    """Log2 histogram of durations."""
+    def __init__(self):
+        self._buckets = [0] * _BUCKETS
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def add(self, seconds):
+        """Add duration to the histogram."""
+        usec = int(seconds * 1e6)
+        self._buckets[min(usec.bit_length(), _BUCKETS - 1)] += 1
+        self._count += 1
+        self._total += seconds
+        self._max = max(self._max, seconds)
+
+    def percentile(self, fraction):
+        """Return the upper bound (in seconds) of the bucket
+        where the given fraction of durations is reached."""
+        target = fraction * self._count
+        seen = 0
+        for bucket, count in enumerate(self._buckets):
+            seen += count
+            if count and seen >= target:
+                return min(2 ** bucket / 1e6, self._max)
+        return self._max
+
+    def summary(self):
+        """Return (count, mean, p50, p90, p99, max); times in seconds."""
+        mean = self._total / self._count if self._count else 0.0
+        return (self._count, mean, self.percentile(0.5),
+                self.percentile(0.9), self.percentile(0.99), self._max)
+
+
+class Instrumentation():
+    """
+    Entity that collects timings of the wrapped functions and,
+    optionally, runs cProfile and saves its stats to profile_file.
+    """
+    def __init__(self, profile_file=None):
+        self._histograms = {}
+        self._profile_file = profile_file
+        self._profiler = None
+        if profile_file:
+            import cProfile  # pylint:disable=import-outside-toplevel
+            self._profiler = cProfile.Profile()
+
+    def record(self, name, seconds):
+        """Add duration to the histogram called name."""
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram()
+        histogram.add(seconds)
+
+    def wrap(self, name, func):
+        """Return func which records its run time as name."""
+        record = self.record
+
+        @wraps(func)
+        def _timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+        return _timed
+
+    def patch(self, owner, names, prefix):
+        """Replace the functions called names in owner (a module
+        or a class) with wrapped ones, named prefix + name."""
+        for name in names:
+            setattr(owner, name,
+                    self.wrap(prefix + name, getattr(owner, name)))
+
+    def start(self):
+        """Start profiler, if any."""
+        if self._profiler:
+            self._profiler.enable()
+
+    def stop(self):
+        """Stop profiler, if any, and save its stats."""
+        if self._profiler:
+            self._profiler.disable()
+            self._profiler.dump_stats(self._profile_file)
+
+    def summary(self):
+        """Return the text table of all histograms."""
+        lines = ["{:40} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+            "ms", "count", "mean", "p50", "p90", "p99", "max")]
+        for name in sorted(self._histograms):
+            count, *times = self._histograms[name].summary()
+            lines.append("{:40} {:7d}".format(name, count) +
+                         "".join(" {:9.3f}".format(t * 1e3) for t in times))
+        if self._profile_file:
+            lines.append("cProfile stats saved to {}.".format(
+                self._profile_file))
+        return "\n".join(lines)
+
+
+def create(option=None):
+    """
+    Return Instrumentation if it is enabled, None otherwise.
+    option is the value of --profile command line option: None if not
+    given, empty string for timings only, or the file for cProfile stats.
+    If it is None, PSGO_PROFILE environment variable is used the same way
+    ('1' means timings only).
+    """
+    if option is None:
+        option = os.environ.get(ENV_VAR, '0')
+        if option in ('0', ''):
+            return None
+        if option == '1':
+            option = ''
+    return Instrumentation(profile_file=option or None)
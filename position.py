@@ -0,0 +1,279 @@
+"""Compact position storage."""
+
+from itertools import compress
+from operator import itemgetter, xor
+from random import Random
+
+from stone import Stone
+
+
+SIZE = 19
+
+_COLOURS = (None, 'black', 'white')
+_CODES = {'black': 1, 'white': 2}
+
+
+def _index(point):
+    p_x, p_y = point
+    return p_y * SIZE + p_x
+
+
+def _point(index):
+    p_y, p_x = divmod(index, SIZE)
+    return (p_x, p_y)
+
+
+def _symmetries():
+    """Return 8 tables mapping point indices to the indices
+    of the points rotated and/or reflected."""
+    last = SIZE - 1
+    tables = [[] for _ in range(8)]
+    for index in range(SIZE * SIZE):
+        p_x, p_y = _point(index)
+        r_x, r_y = last - p_x, last - p_y
+        for table, (t_x, t_y) in zip(tables, (
+                (p_x, p_y), (r_x, p_y), (p_x, r_y), (r_x, r_y),
+                (p_y, p_x), (r_y, p_x), (p_y, r_x), (r_y, r_x))):
+            table.append(t_y * SIZE + t_x)
+    return tables
+
+
+def _zobrist_tables():
+    """
+    Return Zobrist tables: for every point index and colour code,
+    the keys to toggle in the 16 hashes (8 symmetries, then the same
+    with colours swapped); and for every point index, the keys which
+    are multiplied by the label.
+    """
+    rnd = Random(0x5eed)
+    black, white = [], []
+    for _ in range(SIZE * SIZE):
+        black.append(rnd.getrandbits(64))
+        white.append(rnd.getrandbits(64))
+    empty = [0] * (SIZE * SIZE)
+    label_keys = [rnd.getrandbits(64) | 1 for _ in range(SIZE * SIZE)]
+    stones = []
+    labels = []
+    # itemgetter picks the keys of all the symmetric points at once,
+    # which keeps the import fast
+    for points in zip(*_symmetries()):
+        pick = itemgetter(*points)
+        stones.append((pick(empty) * 2, pick(black) + pick(white),
+                       pick(white) + pick(black)))
+        labels.append(pick(label_keys) * 2)
+    return stones, labels
+
+
+_MASK = (1 << 64) - 1
+_STONE_KEYS, _LABEL_KEYS = _zobrist_tables()
+
+
+def stone_key(point, stone):
+    """Return the Zobrist key of the stone at point; the key of
+    a position (see Position.zobrist) is XOR of the keys of its stones."""
+    index = _index(point)
+    key = _STONE_KEYS[index][_CODES[stone.colour]][0]
+    if stone.label:
+        key ^= (_LABEL_KEYS[index][0] * int(stone.label)) & _MASK
+    return key
+
+
+class Position():
+    """
+    Stones on the board, stored as an array of colour codes with
+    a parallel array of numeric labels (0 for no label).
+
+    Behaves like a dict mapping (x, y) points to stones.
+
+    The number of stones in every column and row is maintained,
+    so the occupied extent is known without scanning the stones.
+    Zobrist hashes of the position in all 8 symmetries, with the colours
+    as they are and swapped, are maintained as well.
+    """
+    __slots__ = ('_colours', '_labels', '_count', '_lines', '_extent',
+                 '_keys')
+
+    def __init__(self, stones=None):
+        self._colours = bytearray(SIZE * SIZE)
+        self._labels = bytearray(SIZE * SIZE)
+        self._count = 0
+        # stones per column and per row
+        self._lines = (bytearray(SIZE), bytearray(SIZE))
+        # the biggest occupied column and row, -1 if none
+        self._extent = [-1, -1]
+        # Zobrist hashes: 8 symmetries, then the same with colours swapped
+        self._keys = [0] * 16
+        if stones:
+            for point, stone in stones.items():
+                self[point] = stone
+
+    def _occupy(self, index):
+        self._count += 1
+        for axis, coord in enumerate(_point(index)):
+            self._lines[axis][coord] += 1
+            if coord > self._extent[axis]:
+                self._extent[axis] = coord
+
+    def _vacate(self, index):
+        self._count -= 1
+        for axis, coord in enumerate(_point(index)):
+            lines = self._lines[axis]
+            lines[coord] -= 1
+            if coord == self._extent[axis] and not lines[coord]:
+                while coord >= 0 and not lines[coord]:
+                    coord -= 1
+                self._extent[axis] = coord
+
+    def extent(self, axis):
+        """Return the biggest occupied coordinate along the axis
+        (0 for columns, 1 for rows), or -1 if there are no stones."""
+        return self._extent[axis]
+
+    def _hash(self, index):
+        """Toggle the stone at index in Zobrist hashes."""
+        keys = _STONE_KEYS[index][self._colours[index]]
+        label = self._labels[index]
+        if label:
+            keys = [key ^ ((label_key * label) & _MASK) for key, label_key
+                    in zip(keys, _LABEL_KEYS[index])]
+        self._keys = list(map(xor, self._keys, keys))
+
+    def zobrist(self):
+        """Return Zobrist hash of the position."""
+        return self._keys[0]
+
+    def canonical_key(self):
+        """Return the key which is the same for the position rotated,
+        reflected and/or with colours swapped."""
+        return min(self._keys)
+
+    def _stone(self, index):
+        label = self._labels[index]
+        return Stone(_COLOURS[self._colours[index]],
+                     label=str(label) if label else None)
+
+    def get(self, point, default=None):
+        """Return the stone at point, or default if there is none."""
+        index = _index(point)
+        if self._colours[index]:
+            return self._stone(index)
+        return default
+
+    def __getitem__(self, point):
+        stone = self.get(point)
+        if stone is None:
+            raise KeyError(point)
+        return stone
+
+    def __setitem__(self, point, stone):
+        index = _index(point)
+        if self._colours[index]:
+            self._hash(index)
+        else:
+            self._occupy(index)
+        self._colours[index] = _CODES[stone.colour]
+        self._labels[index] = int(stone.label) if stone.label else 0
+        self._hash(index)
+
+    def __delitem__(self, point):
+        index = _index(point)
+        if not self._colours[index]:
+            raise KeyError(point)
+        self._hash(index)
+        self._colours[index] = 0
+        self._labels[index] = 0
+        self._vacate(index)
+
+    def __contains__(self, point):
+        return bool(self._colours[_index(point)])
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        """Iterate over occupied points."""
+        return map(_point, compress(range(SIZE * SIZE), self._colours))
+
+    def items(self):
+        """Iterate over (point, stone) pairs."""
+        for index in compress(range(SIZE * SIZE), self._colours):
+            yield _point(index), self._stone(index)
+
+    def copy(self):
+        """Return a copy of the position."""
+        res = Position()
+        res._colours[:] = self._colours
+        res._labels[:] = self._labels
+        res._count = self._count
+        res._lines = (self._lines[0][:], self._lines[1][:])
+        res._extent = self._extent[:]
+        res._keys = self._keys[:]
+        return res
+
+
+class Overlay():
+    """
+    Read-only view of a position with another one (solution branch)
+    on top of it; the stones of the top position win, the stones
+    of the base at hidden points (captured ones) are not there.
+    Nothing is copied, but only the base is followed live: the top
+    (an immutable branch, which a change replaces) and hidden are
+    taken as they were, so call Board.get_items() again after the
+    solution changes.
+    """
+    __slots__ = ('_base', '_top', '_hidden')
+
+    def __init__(self, base, top=None, hidden=frozenset()):
+        self._base = base
+        self._top = top
+        self._hidden = hidden
+
+    def get(self, point, default=None):
+        """Return the stone at point, or default if there is none."""
+        if self._top is not None:
+            stone = self._top.get(point)
+            if stone is not None:
+                return stone
+        if point in self._hidden:
+            return default
+        return self._base.get(point, default)
+
+    def __getitem__(self, point):
+        stone = self.get(point)
+        if stone is None:
+            raise KeyError(point)
+        return stone
+
+    def __contains__(self, point):
+        if self._top is not None and point in self._top:
+            return True
+        return point in self._base and point not in self._hidden
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        """Iterate over occupied points."""
+        for point, _ in self.items():
+            yield point
+
+    def items(self):
+        """Iterate over (point, stone) pairs."""
+        top, hidden = self._top, self._hidden
+        if hidden:
+            for point, stone in self._base.items():
+                if point not in hidden and (top is None or point not in top):
+                    yield point, stone
+            if top is not None:
+                yield from top.items()
+            return
+        if top is None:
+            yield from self._base.items()
+            return
+        for point, stone in self._base.items():
+            if point not in top:
+                yield point, stone
+        yield from top.items()
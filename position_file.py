@@ -0,0 +1,78 @@
+"""
+Position description files.
+
+A position description is a plain text file. Empty lines and lines
+starting with '#' are ignored. Main position stones are listed as
+
+    black b3 d3 b4
+    white d5 g2
+
+and every 'solution' line starts a new solution branch, which lists
+numbered stones as
+
+    solution
+    1 black a2
+    2 white b1
+
+Numbers go from 1 to board.MAX_LABEL.
+Points use psgo coordinates: column letter (there is no 'i' column)
+followed by the row number, both counted from the bottom left corner.
+"""
+
+from board import Board, MAX_LABEL
+from stone import Stone
+
+
+_COLOURS = {'black', 'white'}
+
+
+def _parse_point(text, lineno):
+    column, row = text[:1].lower(), text[1:]
+    if not 'a' <= column <= 't' or column == 'i' or not row.isdigit():
+        raise ValueError("line {}: bad point '{}'".format(lineno, text))
+    p_x = ord(column) - ord('a')
+    # no 'i', 'j' is the ninth column
+    if column > 'i':
+        p_x -= 1
+    p_y = int(row) - 1
+    if not 0 <= p_y < 19:
+        raise ValueError("line {}: bad point '{}'".format(lineno, text))
+    return (p_x, p_y)
+
+
+def parse(text):
+    """Parse position description and return the Board."""
+    board = {}
+    solutions = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        if words == ['solution']:
+            solutions.append({})
+        elif words[0] in _COLOURS:
+            if solutions:
+                raise ValueError(
+                    "line {}: unnumbered stones in solution".format(lineno))
+            for word in words[1:]:
+                board[_parse_point(word, lineno)] = Stone(words[0])
+        elif len(words) == 3 and words[0].isdigit() and \
+                words[1] in _COLOURS:
+            if not solutions:
+                raise ValueError(
+                    "line {}: numbered stone outside solution".format(lineno))
+            if not 1 <= int(words[0]) <= MAX_LABEL:
+                raise ValueError("line {}: bad number '{}'".format(
+                    lineno, words[0]))
+            point = _parse_point(words[2], lineno)
+            solutions[-1][point] = Stone(words[1], label=words[0])
+        else:
+            raise ValueError("line {}: cannot parse '{}'".format(
+                lineno, line.strip()))
+    return Board(board, solutions)
+
+
+def load(fname):
+    """Read position description file and return the Board."""
+    with open(fname) as inp:
+        return parse(inp.read())
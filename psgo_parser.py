@@ -0,0 +1,69 @@
+"""
+Read psgo TeX diagrams (as written by export_support) back.
+
+Only the things psgo_emitter writes are understood: partial board
+environment and stones, possibly labelled with marklb.
+"""
+
+import os
+import re
+
+import export_support as xp
+
+from board import Board, MAX_LABEL
+from stone import Stone
+
+
+_STONE = re.compile(r"\\stone(?:\[\\marklb\{(\d+)\}\])?"
+                    r"\{(black|white)\}\{([a-hj-t])\}\{(\d+)\}")
+_COLUMN_INDEX = {letter: idx for idx, letter in enumerate(xp.COLUMNS)}
+
+
+def parse_diagram(lines):
+    """Parse the first diagram in the iterable of lines.
+    Return the dict mapping points to stones."""
+    stones = {}
+    for line in lines:
+        if r"\stone" in line:
+            for match in _STONE.finditer(line):
+                label, colour, column, row = match.groups()
+                p_y = int(row) - 1
+                if not 0 <= p_y < 19:
+                    raise ValueError("bad row in '{}'".format(match.group()))
+                if label is not None and not 0 < int(label) <= MAX_LABEL:
+                    raise ValueError("bad number in '{}'".format(
+                        match.group()))
+                stones[(_COLUMN_INDEX[column], p_y)] = Stone(colour, label)
+        if r"\end{psgopartialboard}" in line:
+            break
+    return stones
+
+
+def read_diagram(fname):
+    """Read the diagram from the file.
+    Return the dict mapping points to stones."""
+    with open(fname) as inp:
+        return parse_diagram(inp)
+
+
+def read(fname):
+    """
+    Read the problem from fname and its solutions from the files named
+    as export_support.solution_file_name() does, while they exist.
+    Return (main position, list of solution branches); they are dicts
+    mapping points to stones, branches have numbered stones only.
+    """
+    main = read_diagram(fname)
+    solutions = []
+    while True:
+        sol_name = xp.solution_file_name(fname, len(solutions))
+        if not os.path.exists(sol_name):
+            break
+        solutions.append({point: stone for point, stone
+                          in read_diagram(sol_name).items() if stone.label})
+    return main, solutions
+
+
+def load(fname):
+    """Read the problem with its solutions and return the Board."""
+    return Board(*read(fname))
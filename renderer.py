@@ -31,6 +31,19 @@ class Renderer():
         self._title = ""
         self._solution_idx = None
 
+        # Frames map screen cells (x, y) to (char, colour, attr);
+        # only the cells which differ from the last frame are printed.
+        self._frame = {}
+        self._last_frame = {}
+        self._dimensions = None
+
+        # Screen cells and empty point glyphs of the board rows,
+        # recomputed when the screen size or the display changes
+        self._tables_key = None
+        self._row_cells = []
+        self._row_glyphs = []
+        self._stone_glyphs = {}
+
     def _update_borders(self):
         self._borders = {'left': self._sc_col(-1) - 1,
                          'right': self._sc_col(19) + 1,
@@ -54,12 +67,28 @@ class Renderer():
     def _is_hoshi(self, col, row):
         return (col - 3) % 6 == 0 and (row - 3) % 6 == 0
 
-    def _pr(self, piece, scr_coord):
-        self._screen.print_at(self._ctbl[piece], *scr_coord)
+    def _print_at(self, text, col, row,
+                  colour=Screen.COLOUR_WHITE, attr=Screen.A_NORMAL):
+        for shift, char in enumerate(text):
+            self._frame[(col + shift, row)] = (char, colour, attr)
 
-    def _bd(self, piece, scr_coord):
-        self._screen.print_at(self._ctbl[piece], *scr_coord,
-                              Screen.COLOUR_WHITE, Screen.A_BOLD)
+    def _pr(self, piece, scr_coord):
+        self._print_at(self._ctbl[piece], *scr_coord)
+
+    def _update_tables(self):
+        key = (self._screen.dimensions, self._config['display'])
+        if key == self._tables_key:
+            return
+        self._tables_key = key
+        normal = (Screen.COLOUR_WHITE, Screen.A_NORMAL)
+        empty = (self._ctbl['empty'],) + normal
+        hoshi = (self._ctbl['hoshi'], Screen.COLOUR_WHITE, Screen.A_BOLD)
+        self._row_cells = [[self._to_scr(col, row) for col in range(19)]
+                           for row in range(19)]
+        self._row_glyphs = [[hoshi if self._is_hoshi(col, row) else empty
+                             for col in range(19)] for row in range(19)]
+        self._stone_glyphs = {colour: (self._ctbl[colour],) + normal
+                              for colour in ('black', 'white')}
 
     def _is_stone(self, thing):
         return thing == 'white' or thing == 'black'
@@ -71,33 +100,71 @@ class Renderer():
         scr_colour = {'white': Screen.COLOUR_YELLOW,
                       'black': Screen.COLOUR_BLUE}[stone.colour]
         # No configurable display for numbers yet. Fix!
-        self._screen.print_at(stone.label, *scr_coord,
-                              scr_colour, Screen.A_BOLD)
+        # A point is two columns wide: 100 and on show the last digits.
+        self._print_at(stone.label[-2:], *scr_coord,
+                       scr_colour, Screen.A_BOLD)
 
-    def _disp(self, point, stone):
-        self._update_ctbl()
-        scr_coord = self._to_scr(*point)
-        if stone:
-            if stone.label:
-                self._pr_labeled(stone, scr_coord)
-            else:
-                self._pr(stone.colour, scr_coord)
-        elif self._is_hoshi(*point):
-            self._bd('hoshi', scr_coord)
-        else:
-            self._pr('empty', scr_coord)
+    def _vline(self, char, col, top, bottom):
+        for row in range(top, bottom + 1):
+            self._print_at(char, col, row)
+
+    def _hline(self, char, left, right, row):
+        self._print_at(char * (right - left), left, row)
 
     def _render_cursor(self, cur_pos):
         cur_x, cur_y = self._to_scr(*cur_pos)
         self._pr('cur_left', (cur_x - 1, cur_y))
         self._pr('cur_right', (cur_x + 1, cur_y))
 
+    def _print_runs(self, row, left, right):
+        """Print the cells of the row from left to right column
+        with one print_at per run of the same colour and attribute.
+        Empty cells are spaces, which can join any run."""
+        frame = self._frame
+        start, chars, style = left, [], None
+        for col in range(left, right + 1):
+            value = frame.get((col, row))
+            if value is None:
+                chars.append(' ')
+                continue
+            if style is not None and value[1:] != style:
+                self._screen.print_at(''.join(chars), start, row, *style)
+                start, chars = col, []
+            style = value[1:]
+            chars.append(value[0])
+        self._screen.print_at(''.join(chars), start, row,
+                              *(style or (Screen.COLOUR_WHITE,
+                                          Screen.A_NORMAL)))
+
+    def _flush(self):
+        frame, last = self._frame, self._last_frame
+        # changed columns by row
+        changed = {}
+        for cell, value in frame.items():
+            if last.get(cell) != value:
+                changed.setdefault(cell[1], []).append(cell[0])
+        for col, row in last.keys() - frame.keys():
+            changed.setdefault(row, []).append(col)
+        for row, cols in changed.items():
+            self._print_runs(row, min(cols), max(cols))
+
+    def invalidate(self):
+        """Forget the last frame, so the next one is drawn from scratch."""
+        self._dimensions = None
+
     def begin(self):
         """Start rendering."""
-        self._screen.clear()
+        if self._screen.dimensions != self._dimensions:
+            self._screen.clear()
+            self._dimensions = self._screen.dimensions
+            self._last_frame = {}
+        self._frame = {}
 
     def end(self):
-        """End rendering."""
+        """End rendering: draw what changed since the last frame."""
+        self._flush()
+        self._last_frame = self._frame
+        self._frame = {}
         self._screen.refresh()
 
     def set_title(self, title):
@@ -125,23 +192,23 @@ class Renderer():
         self._update_ctbl()
         schar = self._ctbl[colour]
         line = self._screen.dimensions[0] - 1
-        self._screen.print_at("Mode: {} Colour: {}".format(mode, schar),
-                              4, line,
-                              Screen.COLOUR_GREEN, Screen.A_BOLD)
+        self._print_at("Mode: {} Colour: {}".format(mode, schar),
+                       4, line,
+                       Screen.COLOUR_GREEN, Screen.A_BOLD)
         if self._flash:
             message, severity = self._flash
             msg_colour = {'INFO': Screen.COLOUR_BLUE,
                           'WARNING': Screen.COLOUR_YELLOW,
                           'ERROR': Screen.COLOUR_RED}[severity]
-            self._screen.print_at(message, 28, line, msg_colour, Screen.A_BOLD)
+            self._print_at(message, 28, line, msg_colour, Screen.A_BOLD)
             self._flash = ()
 
-        self._screen.print_at(self._title, 0, 0,
-                              Screen.COLOUR_BLUE, Screen.A_BOLD)
+        self._print_at(self._title, 0, 0,
+                       Screen.COLOUR_BLUE, Screen.A_BOLD)
         if self._solution_idx is not None:
             line = "[Solution: {}]".format(self._solution_idx + 1)
-            self._screen.print_at(line, 0, 1,
-                                  Screen.COLOUR_RED, Screen.A_BOLD)
+            self._print_at(line, 0, 1,
+                           Screen.COLOUR_RED, Screen.A_BOLD)
 
     def render_board(self, board):
         """Render stuff to the screen"""
@@ -154,34 +221,40 @@ class Renderer():
         cur_pos = board.get_cursor()
 
         self._update_ctbl()
+        self._update_tables()
         self._update_borders()
+        frame = self._frame
         for row in range(max_height):
-            for column in range(max_width):
-                point = (column, row)
-                thing = stuff_dict.get(point)
-                self._disp(point, thing)
+            frame.update(zip(self._row_cells[row][:max_width],
+                             self._row_glyphs[row]))
+        row_cells, stone_glyphs = self._row_cells, self._stone_glyphs
+        for (column, row), stone in stuff_dict.items():
+            if column >= max_width or row >= max_height:
+                continue
+            if stone.label:
+                self._pr_labeled(stone, row_cells[row][column])
+            else:
+                frame[row_cells[row][column]] = stone_glyphs[stone.colour]
 
         # Borders
         bchar = self._ctbl['border']
         highest = self._sc_row(max_height) - 1
         widest = self._sc_col(max_width) + 1
 
+        left, bottom = self._borders['left'], self._borders['bottom']
+
         # Left border
-        self._screen.move(self._borders['left'], self._borders['bottom'])
-        self._screen.draw(self._borders['left'], highest, char=bchar)
+        self._vline(bchar, left, highest, bottom)
 
         # Bottom border
-        self._screen.move(self._borders['left'], self._borders['bottom'])
-        self._screen.draw(widest, self._borders['bottom'], char=bchar)
+        self._hline(bchar, left, widest, bottom)
 
         # Right border
         if max_width == 19:
-            self._screen.move(self._borders['right'], self._borders['bottom'])
-            self._screen.draw(self._borders['right'], highest, char=bchar)
+            self._vline(bchar, self._borders['right'], highest, bottom)
 
         # Top border
         if max_height == 19:
-            self._screen.move(self._borders['left'], self._borders['top'])
-            self._screen.draw(widest, self._borders['top'], char=bchar)
+            self._hline(bchar, left, widest, self._borders['top'])
 
         self._render_cursor(cur_pos)
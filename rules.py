@@ -0,0 +1,295 @@
+"""
+Go rules for solution branches: captures and illegal moves.
+
+A numbered stone put on a setup stone (one still on the board) marks
+that stone: it is a label, not a move, and is skipped.
+
+Chains are kept in a union-find structure with the number of their
+(pseudo) liberties, updated stone by stone, so a move costs the size
+of the chains it touches, never a scan of the board. Every change is
+logged: moves are taken back in reverse order, and following another
+branch takes back only the moves it does not share.
+"""
+
+from itertools import compress
+from random import Random
+
+from position import SIZE, _CODES, _COLOURS, _STONE_KEYS, _index, _point
+
+
+OCCUPIED = 'occupied'
+SUICIDE = 'suicide'
+KO = 'ko'
+
+
+def _neighbours():
+    """Return the tuples of the indices of the points next to every
+    point index."""
+    last = SIZE - 1
+    table = []
+    for index in range(SIZE * SIZE):
+        column = index % SIZE
+        table.append(
+            ((index - 1,) if column else ()) +
+            ((index + 1,) if column < last else ()) +
+            ((index - SIZE,) if index >= SIZE else ()) +
+            ((index + SIZE,) if index < SIZE * last else ()))
+    return table
+
+
+_NEIGHBOURS = _neighbours()
+
+# Zobrist keys of stones (the keys of position) by colour code,
+# and of ko points
+_KEYS = (None,) + tuple([keys[code][0] for keys in _STONE_KEYS]
+                        for code in (1, 2))
+_KO_RANDOM = Random(0x6b6f)
+_KO_KEYS = [_KO_RANDOM.getrandbits(64) for _ in range(SIZE * SIZE)]
+
+
+class Rules():
+    """
+    Entity that plays the moves (numbered stones, in order) on top of
+    the setup stones, which never capture. Illegal moves (on a point
+    occupied by an earlier move, suicide, retaking a ko at once) are
+    flagged and have no effect.
+    """
+    # pylint:disable=too-many-instance-attributes
+    def __init__(self, setup=None):
+        size = SIZE * SIZE
+        self._colours = bytearray(size)
+        # 1 for the points with stones captured
+        self._captured = bytearray(size)
+        # 1 for the points with setup stones (not captured)
+        self._setup = bytearray(size)
+        # union-find: parent, chain size and liberties (for roots)
+        self._parents = list(range(size))
+        self._sizes = [1] * size
+        self._liberties = [0] * size
+        # next stone of the chain, in a circle
+        self._next = list(range(size))
+        # (point index, colour code) of the ko the next move of that
+        # colour cannot retake
+        self._ko = [None]
+        # Zobrist hash of the stones
+        self._key = [0]
+        # (array, index, old value) for every change
+        self._log = []
+        # the length of the log before every move
+        self._marks = []
+        self._moves = []
+        self._errors = []
+        # True for the labels among the moves
+        self._labels = []
+        self._hidden = frozenset()
+        for point, stone in (setup.items() if setup else ()):
+            self._place(_index(point), _CODES[stone.colour])
+            self._setup[_index(point)] = 1
+        # setup is never taken back
+        self._log = []
+
+    def _change(self, array, index, value):
+        self._log.append((array, index, array[index]))
+        array[index] = value
+
+    def _find(self, index):
+        parents = self._parents
+        while parents[index] != index:
+            index = parents[index]
+        return index
+
+    def _place(self, index, code):
+        """Put the stone, merge the chains around. Return its root."""
+        colours, liberties = self._colours, self._liberties
+        self._change(colours, index, code)
+        self._change(self._key, 0, self._key[0] ^ _KEYS[code][index])
+        if self._captured[index]:
+            self._change(self._captured, index, 0)
+        own = 0
+        for neighbour in _NEIGHBOURS[index]:
+            if not colours[neighbour]:
+                own += 1
+            else:
+                root = self._find(neighbour)
+                self._change(liberties, root, liberties[root] - 1)
+        self._change(liberties, index, own)
+        root = index
+        for neighbour in _NEIGHBOURS[index]:
+            if colours[neighbour] == code:
+                root = self._union(root, self._find(neighbour))
+        return root
+
+    def _union(self, first, second):
+        if first == second:
+            return first
+        sizes, liberties, nexts = self._sizes, self._liberties, self._next
+        if sizes[first] < sizes[second]:
+            first, second = second, first
+        self._change(self._parents, second, first)
+        self._change(sizes, first, sizes[first] + sizes[second])
+        self._change(liberties, first, liberties[first] + liberties[second])
+        # join the circles
+        after_first, after_second = nexts[first], nexts[second]
+        self._change(nexts, first, after_second)
+        self._change(nexts, second, after_first)
+        return first
+
+    def _remove(self, root):
+        """Capture the chain. Return the list of its stones."""
+        stones = [root]
+        index = self._next[root]
+        while index != root:
+            stones.append(index)
+            index = self._next[index]
+        code = self._colours[root]
+        for index in stones:
+            self._change(self._key, 0, self._key[0] ^ _KEYS[code][index])
+            self._change(self._colours, index, 0)
+            self._change(self._captured, index, 1)
+            if self._setup[index]:
+                self._change(self._setup, index, 0)
+            self._change(self._parents, index, index)
+            self._change(self._sizes, index, 1)
+            self._change(self._liberties, index, 0)
+            self._change(self._next, index, index)
+        liberties = self._liberties
+        for index in stones:
+            for neighbour in _NEIGHBOURS[index]:
+                if self._colours[neighbour]:
+                    root = self._find(neighbour)
+                    self._change(liberties, root, liberties[root] + 1)
+        return stones
+
+    def _rollback(self, mark):
+        log = self._log
+        while len(log) > mark:
+            array, index, value = log.pop()
+            array[index] = value
+
+    def _play(self, index, code):
+        if self._colours[index]:
+            return OCCUPIED
+        if (index, code) == self._ko[0]:
+            return KO
+        self._change(self._ko, 0, None)
+        root = self._place(index, code)
+        captured = []
+        for neighbour in _NEIGHBOURS[index]:
+            colour = self._colours[neighbour]
+            if colour and colour != code:
+                chain = self._find(neighbour)
+                if not self._liberties[chain]:
+                    captured.extend(self._remove(chain))
+        root = self._find(root)
+        if not self._liberties[root]:
+            return SUICIDE
+        if len(captured) == 1 and self._sizes[root] == 1 and \
+                self._liberties[root] == 1:
+            # barred to the colour of the captured stone
+            self._change(self._ko, 0, (captured[0], 3 - code))
+        return None
+
+    def play(self, point, stone):
+        """Play the stone at point. Return None, or the reason why
+        the move is illegal: OCCUPIED, SUICIDE or KO. A stone on a setup
+        stone is a label: it has no effect and is never illegal."""
+        mark = len(self._log)
+        index = _index(point)
+        label = bool(self._setup[index])
+        error = None if label else self._play(index, _CODES[stone.colour])
+        if error is not None:
+            self._rollback(mark)
+            # the stone is still shown
+            if self._captured[index]:
+                self._change(self._captured, index, 0)
+        self._marks.append(mark)
+        self._moves.append((point, stone))
+        self._errors.append(error)
+        self._labels.append(label)
+        self._hidden = None
+        return error
+
+    def pass_move(self):
+        """Pass: the ko can be retaken after it."""
+        self._marks.append(len(self._log))
+        self._change(self._ko, 0, None)
+        self._moves.append((None, None))
+        self._errors.append(None)
+        self._labels.append(False)
+
+    def undo(self):
+        """Take back the last move (or pass)."""
+        self._rollback(self._marks.pop())
+        self._moves.pop()
+        self._errors.pop()
+        self._labels.pop()
+        self._hidden = None
+
+    def follow(self, moves):
+        """Take back and play moves, so the moves played are the given
+        (point, stone) pairs."""
+        moves = list(moves)
+        played = self._moves
+        common = 0
+        while common < min(len(played), len(moves)) and \
+                played[common] == moves[common]:
+            common += 1
+        while len(played) > common:
+            self.undo()
+        for point, stone in moves[common:]:
+            self.play(point, stone)
+
+    def colour(self, point):
+        """Return the colour of the stone at point, None if it is empty."""
+        return _COLOURS[self._colours[_index(point)]]
+
+    def chain(self, point):
+        """Return the list of points of the chain with the stone at point."""
+        start = _index(point)
+        stones = [point]
+        index = self._next[start]
+        while index != start:
+            stones.append(_point(index))
+            index = self._next[index]
+        return stones
+
+    def liberties(self, point):
+        """Return the set of empty points next to the chain with the stone
+        at point."""
+        colours, nexts = self._colours, self._next
+        start = index = _index(point)
+        result = set()
+        while True:
+            result.update(neighbour for neighbour in _NEIGHBOURS[index]
+                          if not colours[neighbour])
+            index = nexts[index]
+            if index == start:
+                return set(map(_point, result))
+
+    def codes(self):
+        """Return bytes with the colour codes (0 for empty, 1 for black,
+        2 for white) of the points, by index y * SIZE + x."""
+        return bytes(self._colours)
+
+    def zobrist(self):
+        """Return Zobrist hash of the stones on the board (the same as
+        Position gives for them without numbers) and the ko point."""
+        ko = self._ko[0]
+        return self._key[0] if ko is None else self._key[0] ^ _KO_KEYS[ko[0]]
+
+    def captured(self):
+        """Return the set of points where the stones were captured."""
+        if self._hidden is None:
+            self._hidden = frozenset(map(_point, compress(
+                range(SIZE * SIZE), self._captured)))
+        return self._hidden
+
+    def labels(self):
+        """Return the set of points of the stones played as labels."""
+        return {point for (point, _), label
+                in zip(self._moves, self._labels) if label}
+
+    def errors(self):
+        """Return the dict mapping points of illegal moves to reasons."""
+        return {point: error for (point, _), error
+                in zip(self._moves, self._errors) if error is not None}
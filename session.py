@@ -0,0 +1,201 @@
+"""
+Crash-safe session log.
+
+Every change of the board is appended to a binary log file, so
+the session can be rebuilt with replay() after the terminal dies.
+The file starts with a header (magic and the file name pattern)
+followed by fixed size records: operation, branch, point index,
+colour code and label; see _RECORD.
+"""
+
+from time import monotonic
+
+import os
+import struct
+
+from board import Board, MAX_LABEL
+from position import SIZE, _CODES, _COLOURS, _index, _point
+from state import State
+from stone import Stone
+
+
+SESSION_FILE = "psgo_emitter.session"
+
+_MAGIC = b"PSGOLOG2"
+_HEADER = struct.Struct("<8sH")
+# the index field holds the next file index for _SAVED
+_RECORD = struct.Struct("<BHIBH")
+
+# operations
+_SET = 1
+_INSERT = 2
+_DELETE = 3
+_CLEAR = 4
+_STATE = 5
+_SAVED = 6
+
+_MAIN = 0xffff  # branch field for main position / main line
+
+_MODES = ('normal', 'paint', 'erase')
+
+
+def _branch(idx):
+    return _MAIN if idx is None else idx
+
+
+class SessionLog():
+    """
+    Append-only log of board changes. Records are buffered and flushed
+    to the OS by sync(), which also fsyncs the file once in a while.
+    """
+    def __init__(self, out, sync_interval=1.0):
+        self._out = out
+        self._sync_interval = sync_interval
+        self._last_sync = monotonic()
+        self._dirty = False
+
+    @classmethod
+    def create(cls, fname, fname_pattern):
+        """Start the new log in fname, keeping the previous one
+        (if any) as fname + '.old'."""
+        if os.path.exists(fname):
+            os.replace(fname, fname + '.old')
+        out = open(fname, 'wb')
+        pattern = fname_pattern.encode('utf-8')
+        out.write(_HEADER.pack(_MAGIC, len(pattern)))
+        out.write(pattern)
+        log = cls(out)
+        log.sync(force=True)
+        return log
+
+    @classmethod
+    def append(cls, fname, size):
+        """Continue the log in fname after its first size bytes
+        (a torn record at the end is dropped)."""
+        out = open(fname, 'r+b')
+        out.truncate(size)
+        out.seek(size)
+        return cls(out)
+
+    def _write(self, *record):
+        self._out.write(_RECORD.pack(*record))
+        self._dirty = True
+
+    # Board listener interface
+
+    def stone_set(self, idx, point, stone):
+        """Record the change of the stone at point."""
+        if stone is None:
+            self._write(_SET, _branch(idx), _index(point), 0, 0)
+        else:
+            self._write(_SET, _branch(idx), _index(point),
+                        _CODES[stone.colour], int(stone.label or 0))
+
+    def branch_inserted(self, idx, position):
+        """Record the new solution branch."""
+        self._write(_INSERT, idx, 0, 0, 0)
+        for point, stone in position.items():
+            self.stone_set(idx, point, stone)
+
+    def branch_deleted(self, idx):
+        """Record the deletion of the solution branch."""
+        self._write(_DELETE, idx, 0, 0, 0)
+
+    # Session events
+
+    def cleared(self):
+        """Record that the board was cleared."""
+        self._write(_CLEAR, 0, 0, 0, 0)
+
+    def saved(self, idx):
+        """Record that the files were written; idx is the next index."""
+        self._write(_SAVED, 0, idx, 0, 0)
+
+    def state(self, state, cursor):
+        """Record UI state and cursor position."""
+        self._write(_STATE, _branch(state.solution()), _index(cursor),
+                    _CODES[state.colour()], _MODES.index(state.mode()))
+
+    def dirty(self):
+        """Return True if there are records which are not fsynced yet."""
+        return self._dirty
+
+    def sync(self, force=False):
+        """Hand buffered records to the OS; fsync them if forced
+        or if the last fsync was long ago."""
+        self._out.flush()
+        if self._dirty and \
+                (force or monotonic() - self._last_sync >= self._sync_interval):
+            os.fsync(self._out.fileno())
+            self._last_sync = monotonic()
+            self._dirty = False
+
+    def close(self):
+        """Sync and close the log."""
+        self.sync(force=True)
+        self._out.close()
+
+
+def replay(fname, undo_depth=None):
+    """
+    Rebuild the session from the log.
+    Return (file name pattern, next file index, board, state, log size);
+    the log size excludes a torn record at the end, if any.
+    Raise ValueError if fname is not a session log or is corrupt.
+    """
+    with open(fname, 'rb') as inp:
+        data = inp.read()
+    try:
+        magic, length = _HEADER.unpack_from(data)
+    except struct.error as ex:
+        raise ValueError("{} is not a session log".format(fname)) from ex
+    if magic != _MAGIC:
+        raise ValueError("{} is not a session log".format(fname))
+    start = _HEADER.size + length
+    if start > len(data):
+        raise ValueError("{} is truncated".format(fname))
+    fname_pattern = data[_HEADER.size:start].decode('utf-8')
+    size = start + (len(data) - start) // _RECORD.size * _RECORD.size
+
+    def _new_board():
+        if undo_depth is None:
+            return Board()
+        return Board(undo_depth=undo_depth)
+
+    def _check(valid, number):
+        if not valid:
+            raise ValueError("{}: bad record {}".format(fname, number))
+
+    board, state, idx = _new_board(), State(), 1
+    for number, (op, branch, index, colour, label) in enumerate(
+            _RECORD.iter_unpack(data[start:size]), 1):
+        solution = None if branch == _MAIN else branch
+        if op in (_SET, _STATE):
+            _check(index < SIZE * SIZE, number)
+            _check(solution is None or solution < board.solution_count(),
+                   number)
+        if op == _SET:
+            _check(colour < len(_COLOURS) and label <= MAX_LABEL, number)
+            stone = None
+            if colour:
+                stone = Stone(_COLOURS[colour],
+                              label=str(label) if label else None)
+            board.set_stone(_point(index), stone, solution)
+        elif op == _INSERT:
+            _check(branch <= board.solution_count(), number)
+            board.insert_solution(branch)
+        elif op == _DELETE:
+            _check(branch < board.solution_count(), number)
+            board.delete_solution(branch)
+        elif op == _CLEAR:
+            board, state = _new_board(), State()
+        elif op == _SAVED:
+            idx = index
+        elif op == _STATE:
+            _check(colour in (1, 2) and label < len(_MODES), number)
+            state = State(_COLOURS[colour], _MODES[label], solution)
+            board.select_solution(solution)
+            board.set_cursor(_point(index))
+        else:
+            _check(False, number)
+    return fname_pattern, idx, board, state, size
@@ -0,0 +1,257 @@
+"""
+Streaming SGF reader.
+
+SGF collections are read in chunks and game trees are produced one
+at a time, so memory use does not depend on the size of the file.
+Every game becomes a Board: setup stones (AB/AW before the first move)
+are the main position, every line of play (the main line and each
+variation) is a solution branch with numbered stones.
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import export_support as xp
+
+from board import Board, MAX_LABEL
+from stone import Stone
+
+
+CHUNK_SIZE = 1 << 20
+
+# Tokens: punctuation, property identifier or property value
+_TOKEN = re.compile(rb"\s*(?:([();])|([A-Za-z]+)|\[((?:[^\]\\]|\\.)*)\])",
+                    re.DOTALL)
+
+
+def _tokens(inp, chunk_size):
+    """Yield (kind, text) tokens from the binary stream; kind is
+    b'(', b')', b';', 'id' or 'value'."""
+    buf = b""
+    eof = False
+    while not eof:
+        chunk = inp.read(chunk_size)
+        eof = not chunk
+        buf += chunk
+        pos = 0
+        while pos < len(buf):
+            match = _TOKEN.match(buf, pos)
+            if not match or (not eof and match.end() == len(buf)):
+                # A token touching the end of the buffer or an unclosed
+                # value may be incomplete: read more. Skip anything else.
+                if not eof and \
+                        (match or buf[pos:].lstrip()[:1] in (b"", b"[")):
+                    break
+                pos += 1
+                continue
+            pos = match.end()
+            punct, ident, value = match.groups()
+            if punct:
+                yield punct, None
+            elif ident:
+                yield 'id', ident.decode('ascii')
+            elif value is not None:
+                yield 'value', value
+        buf = buf[pos:]
+
+
+def read_games(inp, chunk_size=CHUNK_SIZE):
+    """
+    Yield game trees from the binary stream, one by one.
+    A tree node is a dict with 'props' (property identifier mapped
+    to the list of values, bytes) and 'children' (list of nodes).
+    """
+    # Nodes to attach the variations to, one per open '('
+    stack = []
+    root = None
+    node = None
+    ident = None
+    for kind, text in _tokens(inp, chunk_size):
+        if kind == b'(':
+            stack.append(node)
+        elif kind == b')':
+            if not stack:
+                continue
+            node = stack.pop()
+            if not stack and root is not None:
+                yield root
+                root = node = None
+        elif kind == b';':
+            if not stack:
+                continue
+            new = {'props': {}, 'children': []}
+            if node is None:
+                if root is None:
+                    root = new
+                else:
+                    # several trees in one (...): keep the first one
+                    root['children'].append(new)
+            else:
+                node['children'].append(new)
+            node = new
+            ident = None
+        elif kind == 'id':
+            ident = text
+        elif kind == 'value' and node is not None and ident:
+            node['props'].setdefault(ident, []).append(text)
+
+
+def _point(value, size):
+    if len(value) != 2:
+        return None  # pass
+    p_x, p_y = value[0] - ord('a'), value[1] - ord('a')
+    if not (0 <= p_x < size and 0 <= p_y < size):
+        return None  # pass ('tt') or garbage
+    # SGF counts rows from the top, psgo from the bottom
+    return (p_x, size - 1 - p_y)
+
+
+def _points(value, size):
+    """Return the list of points of the setup value: a point or,
+    in FF[4] compressed lists, a rectangle given by two corners."""
+    if len(value) == 5 and value[2] == ord(':'):
+        first, second = _point(value[:2], size), _point(value[3:], size)
+        if first is None or second is None:
+            return []
+        return [(p_x, p_y)
+                for p_x in range(min(first[0], second[0]),
+                                 max(first[0], second[0]) + 1)
+                for p_y in range(min(first[1], second[1]),
+                                 max(first[1], second[1]) + 1)]
+    point = _point(value, size)
+    return [] if point is None else [point]
+
+
+def _lines(node, size, prefix=()):
+    """Yield the lines of play (tuples of (point, colour))
+    from node to every leaf."""
+    while True:
+        props = node['props']
+        for ident, colour in (('B', 'black'), ('W', 'white')):
+            for value in props.get(ident, ()):
+                point = _point(value, size)
+                if point is not None:
+                    prefix += ((point, colour),)
+        children = node['children']
+        if len(children) != 1:
+            break
+        node = children[0]
+    if not children:
+        yield prefix
+    for child in children:
+        yield from _lines(child, size, prefix)
+
+
+def _setup(root, size):
+    """Return setup stones from the nodes before the first move."""
+    stones = {}
+    node = root
+    while node is not None:
+        props = node['props']
+        if 'B' in props or 'W' in props:
+            break
+        for ident, colour in (('AB', 'black'), ('AW', 'white')):
+            for value in props.get(ident, ()):
+                for point in _points(value, size):
+                    stones[point] = Stone(colour)
+        for value in props.get('AE', ()):
+            for point in _points(value, size):
+                stones.pop(point, None)
+        node = node['children'][0] if node['children'] else None
+    return stones
+
+
+def _orient(points, size):
+    """Return function mapping points to the bottom left corner."""
+    points = list(points)
+    flip_x = flip_y = False
+    if points:
+        flip_x = 2 * sum(p[0] for p in points) > len(points) * (size - 1)
+        flip_y = 2 * sum(p[1] for p in points) > len(points) * (size - 1)
+
+    def _map(point):
+        p_x, p_y = point
+        return (size - 1 - p_x if flip_x else p_x,
+                size - 1 - p_y if flip_y else p_y)
+    return _map
+
+
+def game_to_board(root, warnings=None):
+    """Convert the game tree to Board, moving the position
+    to the bottom left corner. Lines longer than MAX_LABEL moves
+    are cut; if warnings is a list, a note is added to it for each."""
+    size = 19
+    if 'SZ' in root['props']:
+        size = int(root['props']['SZ'][0].split(b':')[0])
+    if size > 19:
+        raise ValueError("board size {} is too big".format(size))
+
+    setup = _setup(root, size)
+    lines = [line for line in _lines(root, size) if line]
+    orient = _orient(list(setup) + [point for line in lines
+                                    for point, _ in line], size)
+
+    board = {orient(point): stone for point, stone in setup.items()}
+    solutions = []
+    for line_number, line in enumerate(lines, 1):
+        if len(line) > MAX_LABEL and warnings is not None:
+            warnings.append("line {} has {} moves, only the first {} "
+                            "are kept".format(line_number, len(line),
+                                              MAX_LABEL))
+        solution = {}
+        for number, (point, colour) in enumerate(line[:MAX_LABEL], 1):
+            solution[orient(point)] = Stone(colour, label=str(number))
+        solutions.append(solution)
+    return Board(board, solutions)
+
+
+def read_boards(fname, chunk_size=CHUNK_SIZE):
+    """Yield Board for every game in the SGF file."""
+    with open(fname, 'rb') as inp:
+        for root in read_games(inp, chunk_size):
+            yield game_to_board(root)
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Convert SGF games to psgo TeX problems.")
+    parser.add_argument('sgf', nargs='+', help="SGF files")
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help="where to write TeX files (default: .)")
+    parser.add_argument('-p', '--prefix', default='problem',
+                        help="TeX file names prefix (default: problem)")
+    parser.add_argument('-s', '--start', type=int, default=1,
+                        help="the first sequential number (default: 1)")
+    args = parser.parse_args(argv)
+
+    idx = args.start
+    failed = 0
+    for fname in args.sgf:
+        with open(fname, 'rb') as inp:
+            for game, root in enumerate(read_games(inp), 1):
+                tex_name = os.path.join(args.output_dir,
+                                        "{}-{}.tex".format(args.prefix, idx))
+                warnings = []
+                try:
+                    board = game_to_board(root, warnings)
+                except ValueError as ex:
+                    errors = ["{}, game {}: {}.".format(fname, game, ex)]
+                else:
+                    errors = xp.write_files(xp.tex_files(tex_name, board))
+                for warning in warnings:
+                    print("{}, game {}: {}.".format(fname, game, warning),
+                          file=sys.stderr)
+                for error in errors:
+                    print(error, file=sys.stderr)
+                failed += bool(errors)
+                idx += 1
+    print("{} problems written, {} failed.".format(
+        idx - args.start - failed, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
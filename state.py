@@ -3,10 +3,10 @@
 
 class State():
     """UI state."""
-    def __init__(self):
-        self._colour = 'black'
-        self._mode = 'normal'
-        self._solution = None
+    def __init__(self, colour='black', mode='normal', solution=None):
+        self._colour = colour
+        self._mode = mode
+        self._solution = solution
 
     # Access state
 
@@ -1,29 +1,58 @@
 """Stone model."""
 
 
+_INTERNED = {}
+
+
 class Stone():
-    """Entity that stores the stone, which can be put on a diagram."""
-    def __init__(self, colour, label=None):
-        self._colour = colour
-        self._label = label
+    """
+    Entity that stores the stone, which can be put on a diagram.
+
+    Stones are immutable and interned: there is only one stone for every
+    colour and label, so they are never copied.
+    """
+    __slots__ = ('_colour', '_label')
+
+    def __new__(cls, colour, label=None):
+        stone = _INTERNED.get((colour, label))
+        if stone is None:
+            assert colour in {'black', 'white'}
+            stone = super().__new__(cls)
+            object.__setattr__(stone, '_colour', colour)
+            object.__setattr__(stone, '_label', label)
+            _INTERNED[(colour, label)] = stone
+        return stone
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Stone is immutable")
+
+    def __reduce__(self):
+        return (Stone, (self._colour, self._label))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return "Stone({!r}, label={!r})".format(self._colour, self._label)
 
     @property
     def colour(self):
         """Colour of the stone: 'black' or 'white'."""
         return self._colour
 
-    @colour.setter
-    def colour(self, value):
-        """Set the colour of the stone."""
-        assert value in {'black', 'white'}
-        self._colour = value
-
     @property
     def label(self):
         """Label on the stone; None if no label."""
         return self._label
 
+    def with_colour(self, colour):
+        """Return the stone of the given colour with the same label."""
+        return Stone(colour, label=self._label)
+
     def flip(self):
-        """Flip the colour of the stone"""
-        self._colour = {'white': 'black',
-                        'black': 'white'}[self._colour]
+        """Return the stone of the other colour: white <-> black."""
+        return self.with_colour({'white': 'black',
+                                 'black': 'white'}[self._colour])
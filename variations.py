@@ -0,0 +1,200 @@
+"""
+Solution branches stored as a tree of moves.
+
+A branch is the sequence of its numbered stones (moves), ordered by
+number. Branches starting with the same moves share the tree nodes
+for them, so the refutations of a problem keep the common moves once,
+and walk() lets the export handle them once.
+"""
+
+from position import SIZE, stone_key
+
+
+def _order(move):
+    (p_x, p_y), stone = move
+    return (int(stone.label or 0), p_y * SIZE + p_x)
+
+
+class _Node():
+    """Move in the tree. The extent and the Zobrist key of the branch
+    ending with this move are kept, they are cheap to get from
+    the parent ones."""
+    __slots__ = ('parent', 'point', 'stone', 'children', 'refs',
+                 'extent', 'key', '_view')
+
+    def __init__(self, parent=None, point=None, stone=None):
+        self.parent = parent
+        self.point = point
+        self.stone = stone
+        # (point, stone) -> _Node
+        self.children = {}
+        # number of branches going through this node
+        self.refs = 0
+        self._view = None
+        if parent is None:
+            self.extent = (-1, -1)
+            self.key = 0
+        else:
+            self.extent = (max(parent.extent[0], point[0]),
+                           max(parent.extent[1], point[1]))
+            self.key = parent.key ^ stone_key(point, stone)
+
+    def path(self):
+        """Return the list of nodes from the first move to this one."""
+        nodes = []
+        node = self
+        while node.parent is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def view(self):
+        """Return Branch ending with this move."""
+        if self._view is None:
+            self._view = Branch(self)
+        return self._view
+
+
+class Branch():
+    """
+    Read-only view of the stones of a branch; behaves like a dict
+    mapping points to stones, the moves are in order. Branches never
+    change: a changed branch is a new one.
+    """
+    __slots__ = ('_node', '_stones')
+
+    def __init__(self, node):
+        self._node = node
+        self._stones = None
+
+    def _dict(self):
+        if self._stones is None:
+            self._stones = {node.point: node.stone
+                            for node in self._node.path()}
+        return self._stones
+
+    def get(self, point, default=None):
+        """Return the stone at point, or default if there is none."""
+        return self._dict().get(point, default)
+
+    def __getitem__(self, point):
+        return self._dict()[point]
+
+    def __contains__(self, point):
+        return point in self._dict()
+
+    def __len__(self):
+        return len(self._dict())
+
+    def __iter__(self):
+        return iter(self._dict())
+
+    def keys(self):
+        """Iterate over occupied points."""
+        return self._dict().keys()
+
+    def items(self):
+        """Iterate over (point, stone) pairs, in the order of moves."""
+        return self._dict().items()
+
+    def last_label(self):
+        """Return the number of the last move, 0 if there are none."""
+        stone = self._node.stone
+        return int(stone.label or 0) if stone else 0
+
+    def extent(self, axis):
+        """Return the biggest occupied coordinate along the axis
+        (0 for columns, 1 for rows), or -1 if there are no stones."""
+        return self._node.extent[axis]
+
+    def zobrist(self):
+        """Return Zobrist hash of the stones, as Position does."""
+        return self._node.key
+
+
+class VariationTree():
+    """
+    Entity that stores the list of solution branches as a tree
+    of moves; nodes are shared by the branches with the same first
+    moves and dropped when no branch uses them any more.
+    """
+    def __init__(self, branches=None):
+        self._root = _Node()
+        # the last node of every branch
+        self._leaves = []
+        for stones in branches or []:
+            self.insert(len(self._leaves), stones)
+
+    def _attach(self, moves):
+        node = self._root
+        for move in sorted(moves, key=_order):
+            child = node.children.get(move)
+            if child is None:
+                child = node.children[move] = _Node(node, *move)
+            child.refs += 1
+            node = child
+        return node
+
+    def _detach(self, node):
+        while node.parent is not None:
+            node.refs -= 1
+            if not node.refs:
+                del node.parent.children[(node.point, node.stone)]
+            node = node.parent
+
+    def __len__(self):
+        return len(self._leaves)
+
+    def branch(self, idx):
+        """Return Branch idx."""
+        return self._leaves[idx].view()
+
+    def insert(self, idx, stones=None):
+        """Insert the branch with stones (dict or Branch) at idx."""
+        self._leaves.insert(idx, self._attach(
+            stones.items() if stones else ()))
+
+    def pop(self, idx):
+        """Remove branch idx and return it."""
+        node = self._leaves.pop(idx)
+        self._detach(node)
+        return node.view()
+
+    def set_stone(self, idx, point, stone):
+        """Put the stone (None to remove) at point in branch idx.
+        A branch has one move per point: the move there is replaced."""
+        old = self._leaves[idx]
+        moves = [(node.point, node.stone) for node in old.path()
+                 if node.point != point]
+        if stone is not None:
+            moves.append((point, stone))
+        # attach first, so the shared nodes stay
+        self._leaves[idx] = self._attach(moves)
+        self._detach(old)
+
+    def walk(self):
+        """
+        Visit the tree depth first. Yield (indices of the branches
+        ending there, list of nodes from the first move) for every node
+        where some branches end. The list is reused: the nodes of the
+        common moves are visited once for all the branches.
+        """
+        ends = {}
+        for idx, leaf in enumerate(self._leaves):
+            ends.setdefault(leaf, []).append(idx)
+        if self._root in ends:
+            yield ends[self._root], []
+        path = []
+        stack = [iter(self._root.children.values())]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                if path:
+                    path.pop()
+                continue
+            path.append(node)
+            if node in ends:
+                yield ends[node], path
+            stack.append(iter(node.children.values()))
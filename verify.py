@@ -0,0 +1,332 @@
+"""
+Tsumego verifier.
+
+The side to move tries to capture the biggest chain of the other
+colour (or, with --live, to keep its own biggest chain on the board)
+playing only inside the diagram region, the part of the board that
+get_width/get_height give for the problem; nobody plays out of it,
+so a chain with a liberty there is never captured. The search is
+a depth-limited alpha-beta search (with boolean results it is an
+AND/OR tree search) with a Zobrist-keyed transposition table of
+fixed size. A chain is "alive" when it cannot
+be captured within the search depth.
+
+Every solution branch is played and the search goes on from where it
+ends: the branch is confirmed if the goal is reached, refuted if not
+(or if it has an illegal move) and unknown if the search runs out
+of nodes.
+"""
+
+import argparse
+import sys
+
+import export_support as xp
+import psgo_parser
+
+from batch import problem_files, run_all
+from position import _index
+from rules import Rules
+from stone import Stone
+
+
+DEPTH = 16
+NODES = 200000
+TABLE_BITS = 20
+
+CONFIRMED = 'confirmed'
+REFUTED = 'refuted'
+UNKNOWN = 'unknown'
+
+_OTHER = {'black': 'white', 'white': 'black'}
+# mixed into the keys when the attacker is to move
+_ATTACKER_KEY = 0x2545f4914f6cdd1d
+
+
+class OutOfNodes(Exception):
+    """The search visited the allowed number of nodes."""
+
+
+def _name(point):
+    return "{}{}".format(xp.COLUMNS[point[0]], point[1] + 1)
+
+
+def _neighbours(point):
+    p_x, p_y = point
+    return ((p_x - 1, p_y), (p_x + 1, p_y), (p_x, p_y - 1), (p_x, p_y + 1))
+
+
+class TranspositionTable():
+    """
+    Results of searched positions in a table of 2**bits slots, so its
+    memory is bounded; a new entry replaces the one in its slot.
+    """
+    def __init__(self, bits=TABLE_BITS):
+        self._mask = (1 << bits) - 1
+        self._slots = [None] * (1 << bits)
+
+    def get(self, key, depth):
+        """Return the result (True if the attacker wins) known for
+        the position searched to depth, None if not known."""
+        entry = self._slots[key & self._mask]
+        if entry is None or entry[0] != key:
+            return None
+        _, known_depth, result = entry
+        # a capture found stays found deeper, an escape stays shallower
+        if result and depth >= known_depth or \
+                not result and depth <= known_depth:
+            return result
+        return None
+
+    def put(self, key, depth, result):
+        """Remember the result of the position searched to depth."""
+        self._slots[key & self._mask] = (key, depth, result)
+
+
+class Solver():
+    """
+    Entity that searches whether the attacker captures the target chain
+    (given by one of its points) in the region.
+    """
+    # pylint:disable=too-many-arguments
+    def __init__(self, rules, region, attacker, target, nodes=NODES,
+                 table=None):
+        self._rules = rules
+        self._region = frozenset(region)
+        # (point, index, indices of the neighbours in the region)
+        self._points = [
+            (point, _index(point), [_index(neighbour) for neighbour
+                                    in _neighbours(point)
+                                    if neighbour in self._region])
+            for point in region]
+        self._attacker = attacker
+        self._target = target
+        self._target_colour = _OTHER[attacker]
+        self._limit = nodes
+        self._nodes = nodes
+        self._table = table or TranspositionTable()
+        self._stones = {colour: Stone(colour) for colour in _OTHER}
+
+    def is_captured(self):
+        """Return True if the target chain is not on the board."""
+        return self._rules.colour(self._target) != self._target_colour
+
+    def _moves(self, liberties):
+        """Empty points of the region, the liberties of the target and
+        the points next to stones first."""
+        codes = self._rules.codes()
+        liberties = [point for point in sorted(liberties)
+                     if point in self._region]
+        near = []
+        far = []
+        for point, index, neighbours in self._points:
+            if codes[index] or point in liberties:
+                continue
+            if any(codes[neighbour] for neighbour in neighbours):
+                near.append(point)
+            else:
+                far.append(point)
+        return liberties + near + far
+
+    def _search(self, colour, depth):
+        """Return True if the attacker wins with colour to move."""
+        if self.is_captured():
+            return True
+        liberties = self._rules.liberties(self._target)
+        attacking = colour == self._attacker
+        # every attacker move takes one liberty at most, and those
+        # out of the region are never taken
+        if (depth + attacking) // 2 < len(liberties) or \
+                not liberties <= self._region:
+            return False
+        key = self._rules.zobrist() ^ (_ATTACKER_KEY if attacking else 0)
+        known = self._table.get(key, depth)
+        if known is not None:
+            return known
+        self._nodes -= 1
+        if self._nodes < 0:
+            raise OutOfNodes()
+
+        rules = self._rules
+        result = not attacking
+        if not attacking:
+            # the defender may pass; if that is enough, nothing else
+            # has to be tried
+            rules.pass_move()
+            result = self._search(_OTHER[colour], depth - 1)
+            rules.undo()
+        if attacking or result:
+            if attacking and (depth + 1) // 2 == len(liberties):
+                # no time for anything but taking the liberties
+                moves = sorted(liberties)
+            else:
+                moves = self._moves(liberties)
+            stone = self._stones[colour]
+            for point in moves:
+                if rules.play(point, stone) is None:
+                    wins = self._search(_OTHER[colour], depth - 1)
+                else:
+                    wins = None
+                rules.undo()
+                if wins is attacking:
+                    result = attacking
+                    break
+        self._table.put(key, depth, result)
+        return result
+
+    def attacker_wins(self, colour, depth=DEPTH):
+        """Return True if the attacker captures the target with colour
+        to move, False if not within depth moves, None if the search
+        runs out of nodes."""
+        self._nodes = self._limit
+        try:
+            return self._search(colour, depth)
+        except OutOfNodes:
+            return None
+
+
+def _biggest_chain(rules, region, colour):
+    best = []
+    seen = set()
+    for point in region:
+        if point in seen or rules.colour(point) != colour:
+            continue
+        chain = rules.chain(point)
+        seen.update(chain)
+        if len(chain) > len(best):
+            best = chain
+    return min(best) if best else None
+
+
+def _played(rules, moves):
+    """Follow the moves, return those which are not labels."""
+    rules.follow(moves)
+    labels = rules.labels()
+    return [(point, stone) for point, stone in moves if point not in labels]
+
+
+def verify(board, colour=None, live=False, depth=DEPTH, nodes=NODES,
+           table_bits=TABLE_BITS):
+    """
+    Verify the problem and its solution branches. colour is the side
+    to move (by default the colour of the first move of the first
+    branch, or black); stones put on setup stones are labels, not moves. Return (problem result, list of branch results);
+    a result is (CONFIRMED, REFUTED or UNKNOWN, description).
+    """
+    # pylint:disable=too-many-arguments,too-many-locals
+    branches = [board.get_moves(idx)
+                for idx in range(board.solution_count())]
+    rules = Rules(board.get_items(main_only=True))
+    if colour is None:
+        first = _played(rules, branches[0]) if branches else []
+        rules.follow([])
+        colour = first[0][1].colour if first else 'black'
+    region = [(p_x, p_y) for p_y in range(board.get_height(False))
+              for p_x in range(board.get_width(False))]
+    attacker = _OTHER[colour] if live else colour
+    target = _biggest_chain(rules, region, _OTHER[attacker])
+    if target is None:
+        result = (UNKNOWN, "no {} stones to {}".format(
+            _OTHER[attacker], "save" if live else "capture"))
+        return result, [result] * len(branches)
+    goal = "{} {} {}".format(colour, "saves" if live else "captures",
+                             _name(target))
+    solver = Solver(rules, region, attacker, target, nodes,
+                    TranspositionTable(table_bits))
+
+    def _outcome(to_move):
+        wins = solver.attacker_wins(to_move, depth)
+        if wins is None:
+            return UNKNOWN, "{}: out of nodes".format(goal)
+        if wins is not live:
+            return CONFIRMED, goal
+        if live:
+            return REFUTED, "{}: it is captured".format(goal)
+        return REFUTED, "{}: not within {} moves".format(goal, depth)
+
+    result = _outcome(colour)
+    results = []
+    for moves in branches:
+        moves = _played(rules, moves)
+        errors = rules.errors()
+        illegal = [(int(stone.label or 0), point) for point, stone in moves
+                   if point in errors]
+        if illegal:
+            number, point = min(illegal)
+            results.append((REFUTED, "move {} at {} is illegal ({})".format(
+                number, _name(point), errors[point])))
+        elif solver.is_captured():
+            results.append((REFUTED, goal + ": it is captured") if live
+                           else (CONFIRMED, goal))
+        else:
+            results.append(_outcome(
+                _OTHER[moves[-1][1].colour] if moves else colour))
+    rules.follow([])
+    return result, results
+
+
+def verify_file(fname, options):
+    """Verify one problem TeX file (with its solutions) with verify()
+    options. Return (fname, verify() result or None, list of errors)."""
+    try:
+        board = psgo_parser.load(fname)
+    except (OSError, ValueError) as ex:
+        return fname, None, ["Cannot read {}: {}.".format(fname, ex)]
+    return fname, verify(board, **options), []
+
+
+def verify_all(fnames, options, jobs=None):
+    """Verify all the files, using a pool of jobs processes (one per
+    core by default, none if jobs is 1). Yield verify_file results
+    in order."""
+    yield from run_all(verify_file, fnames, options, jobs)
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Check that psgo TeX problems and their solutions "
+        "work, searching the diagram region.")
+    parser.add_argument('paths', nargs='+',
+                        help="problem TeX files or directories with them")
+    parser.add_argument('-c', '--colour', choices=('black', 'white'),
+                        help="side to move (default: the colour of the "
+                        "first move of the first solution, or black)")
+    parser.add_argument('--live', action='store_true',
+                        help="the side to move saves its biggest chain "
+                        "(default: it captures the biggest other one)")
+    parser.add_argument('-d', '--depth', type=int, default=DEPTH,
+                        help="moves to search (default: {})".format(DEPTH))
+    parser.add_argument('-n', '--nodes', type=int, default=NODES,
+                        help="positions to search per problem and branch "
+                        "(default: {})".format(NODES))
+    parser.add_argument('-t', '--table-bits', type=int, default=TABLE_BITS,
+                        help="transposition table has 2**BITS entries "
+                        "(default: {})".format(TABLE_BITS))
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes (default: cores)")
+    args = parser.parse_args(argv)
+
+    options = {'colour': args.colour, 'live': args.live, 'depth': args.depth,
+               'nodes': args.nodes, 'table_bits': args.table_bits}
+    counts = {CONFIRMED: 0, REFUTED: 0, UNKNOWN: 0}
+    failed = 0
+    for fname, verified, errors in verify_all(problem_files(args.paths),
+                                              options, args.jobs):
+        for error in errors:
+            print(error, file=sys.stderr)
+        if errors:
+            failed += 1
+            continue
+        (status, note), results = verified
+        print("{}: {} ({}).".format(fname, status, note))
+        for number, (status, note) in enumerate(results, 1):
+            counts[status] += 1
+            print("    solution {}: {} ({}).".format(number, status, note))
+    print("{} solutions confirmed, {} refuted, {} unknown; "
+          "{} files failed.".format(counts[CONFIRMED], counts[REFUTED],
+                                    counts[UNKNOWN], failed))
+    return 1 if failed or counts[REFUTED] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
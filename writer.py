@@ -0,0 +1,54 @@
+"""Background file writer."""
+
+from queue import Empty, Queue
+from threading import Thread
+
+import export_support as xp
+
+
+class BackgroundWriter():
+    """
+    Entity that writes files in a background thread, so slow disks
+    do not block the UI. Finished jobs are collected with poll().
+    """
+    def __init__(self):
+        self._jobs = Queue()
+        self._results = Queue()
+        self._pending = 0
+        self._thread = Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            files, tag = job
+            self._results.put((tag, xp.write_files(files)))
+
+    def submit(self, files, tag):
+        """Queue (file name, content) pairs for writing.
+        The tag is returned by poll() when the job is finished."""
+        self._pending += 1
+        self._jobs.put((files, tag))
+
+    def pending(self):
+        """Return the number of unfinished jobs."""
+        return self._pending
+
+    def poll(self):
+        """Return the list of (tag, errors) for the jobs finished
+        since the last call."""
+        done = []
+        while True:
+            try:
+                done.append(self._results.get_nowait())
+            except Empty:
+                break
+        self._pending -= len(done)
+        return done
+
+    def close(self):
+        """Finish all queued jobs and stop the thread."""
+        self._jobs.put(None)
+        self._thread.join()